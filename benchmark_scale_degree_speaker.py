@@ -0,0 +1,195 @@
+"""
+Benchmarks for the hot paths of scale_degree_speaker.py.
+
+    python benchmark_scale_degree_speaker.py                           # run every case
+    python benchmark_scale_degree_speaker.py -k sine                   # only cases whose name contains "sine"
+    python benchmark_scale_degree_speaker.py --save baseline.json      # store the results as a baseline
+    python benchmark_scale_degree_speaker.py --compare baseline.json   # flag cases slower than the baseline
+
+Each case is timed with timeit: the call count is chosen automatically (at least ~0.2s per run), the run
+is repeated and the fastest time per call is reported, which is the least noisy estimate. With --compare
+the exit status is 1 if any case is more than --tolerance slower than its baseline, so it can gate CI.
+Baselines are machine specific; store one per machine rather than committing it.
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import platform
+import random
+import sys
+import timeit
+
+import scale_degree_speaker as sds
+
+# --- Benchmark Settings ---
+REPEAT = 5 # Timed runs per case; the fastest is reported
+DEFAULT_TOLERANCE = 0.2 # --compare fails on cases more than 20% slower than the baseline
+SINE_DURATIONS_SEC = (0.1, 0.5, 2.0)
+SINE_CHANNEL_COUNTS = (1, 2)
+SELECTION_ELEMENT_COUNTS = (12, 1000)
+SELECTION_PLAYS_PER_ROOT = (1, 4)
+RENDER_SESSION_MINUTES = (1, 10)
+# Degree spellings as users type them, exercising every normalization branch
+DEGREE_INPUTS = ["1", "b3", "flat 3", "FLAT3", "#11", "sharp 11", " 5 ", "b13", "flat 9", "#4", "7", "13"]
+ROOT_NOTES = ["C", "Db", "F#", "Bb", "E", "Ab"]
+
+# --- Benchmark Cases ---
+# Each case is a (name, setup) pair; setup() prepares state and returns the zero-argument callable to time.
+def sine_wave_case(duration_sec, num_channels):
+    def setup():
+        return lambda: sds.generate_sine_wave_array(440.0, duration_sec, num_channels=num_channels)
+    return f"sine_wave[{duration_sec}s,{num_channels}ch]", setup
+
+def sine_wave_reference_case(duration_sec, num_channels):
+    # The linspace + sin implementation the wavetable oscillator replaced, kept as a yardstick for sine_wave
+    def setup():
+        def run():
+            t = sds.numpy.linspace(0, duration_sec, int(sds.SAMPLE_RATE * duration_sec), endpoint=False)
+            mono = (sds.numpy.sin(440.0 * t * 2 * sds.numpy.pi) * (2**15 - 1) * sds.TONE_AMPLITUDE_FACTOR).astype(sds.numpy.int16)
+            return sds.numpy.ascontiguousarray(sds.numpy.column_stack((mono,) * num_channels)) if num_channels > 1 else mono
+        return run
+    return f"sine_wave_reference[{duration_sec}s,{num_channels}ch]", setup
+
+def tone_renderer_case(duration_sec, num_channels):
+    def setup():
+        renderer = sds.ToneRenderer(num_channels)
+        return lambda: renderer.render(440.0, duration_sec)
+    return f"tone_renderer[{duration_sec}s,{num_channels}ch]", setup
+
+def normalize_degree_case():
+    def setup():
+        def run():
+            for degree in DEGREE_INPUTS:
+                sds.normalize_degree_string(degree)
+        return run
+    return f"normalize_degree_string[x{len(DEGREE_INPUTS)}]", setup
+
+def note_name_case():
+    def setup():
+        # Every degree over every root, the way the session table calls it
+        lookups = []
+        for root_note in ROOT_NOTES:
+            root_midi = sds.calculate_root_midi_note(root_note, 4)
+            for degree in DEGREE_INPUTS:
+                interval = sds.DEGREE_SEMITONE_INTERVALS[sds.normalize_degree_string(degree)]
+                lookups.append((root_midi + interval, root_note, degree))
+        def run():
+            for midi_note_number, root_note, degree in lookups:
+                sds.get_note_name_from_midi(midi_note_number, root_note, degree)
+        return run
+    return f"get_note_name_from_midi[x{len(ROOT_NOTES) * len(DEGREE_INPUTS)}]", setup
+
+def selection_case(num_elements, plays_per_root):
+    def setup():
+        # One full root-note pass: draw until every element has been played plays_per_root times
+        pool = sds.EligibleElementPool(range(num_elements), plays_per_root, random.Random(0))
+        def run():
+            pool.reset()
+            while not pool.is_complete:
+                pool.draw()
+        return run
+    return f"selection[{num_elements}el,x{plays_per_root}]", setup
+
+def render_session_case(minutes):
+    def setup():
+        config = sds.SessionConfig(
+            elements=sorted(set(DEGREE_INPUTS)), root_notes=ROOT_NOTES, plays_per_root=2, delay=3.0,
+            audio_backend="null", render_duration=minutes * 60.0, tts_backend="fake",
+        )
+        def run():
+            # Console output is part of the session's cost, so it is written to devnull rather than skipped
+            with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+                asyncio.run(sds.run_session(config))
+        return run
+    return f"render_session[{minutes}min,null,fake]", setup
+
+def get_benchmark_cases():
+    cases = []
+    for duration_sec in SINE_DURATIONS_SEC:
+        for num_channels in SINE_CHANNEL_COUNTS:
+            cases.append(sine_wave_case(duration_sec, num_channels))
+            cases.append(sine_wave_reference_case(duration_sec, num_channels))
+            cases.append(tone_renderer_case(duration_sec, num_channels))
+    cases.append(normalize_degree_case())
+    cases.append(note_name_case())
+    for num_elements in SELECTION_ELEMENT_COUNTS:
+        for plays_per_root in SELECTION_PLAYS_PER_ROOT:
+            cases.append(selection_case(num_elements, plays_per_root))
+    for minutes in RENDER_SESSION_MINUTES:
+        cases.append(render_session_case(minutes))
+    return cases
+
+# --- Timing and Baselines ---
+def time_case(run, repeat=REPEAT):
+    """Returns the fastest time (s) per call of run over repeat timed runs."""
+    timer = timeit.Timer(run)
+    number, _ = timer.autorange() # Calls per run, so that one run takes at least 0.2s
+    return min(timer.repeat(repeat=repeat, number=number)) / number
+
+def format_duration(seconds):
+    if seconds < 1e-3:
+        return f"{seconds * 1e6:9.2f} us"
+    if seconds < 1.0:
+        return f"{seconds * 1e3:9.2f} ms"
+    return f"{seconds:9.2f} s "
+
+def load_baseline(baseline_path):
+    with open(baseline_path) as baseline_file:
+        return json.load(baseline_file)["results"]
+
+def save_baseline(baseline_path, results):
+    baseline = {
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "platform": platform.platform(),
+        "results": results, # Case name -> seconds per call
+    }
+    with open(baseline_path, "w") as baseline_file:
+        json.dump(baseline, baseline_file, indent=2)
+
+# --- Main Program ---
+def main():
+    parser = argparse.ArgumentParser(description='Benchmarks the hot paths of scale_degree_speaker.py.')
+    parser.add_argument('-k', dest='name_filter', type=str, default=None, help='Only run cases whose name contains this text.')
+    parser.add_argument('--save', type=str, default=None, metavar='JSON_PATH', help='Store the results as a baseline in this file.')
+    parser.add_argument('--compare', type=str, default=None, metavar='JSON_PATH', help='Compare against a stored baseline; exit status 1 on regressions.')
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE, help=f'Allowed slowdown vs. the baseline as a fraction (default: {DEFAULT_TOLERANCE}).')
+    parser.add_argument('--repeat', type=int, default=REPEAT, help=f'Timed runs per case; the fastest is reported (default: {REPEAT}).')
+    args = parser.parse_args()
+
+    baseline = {}
+    if args.compare:
+        try:
+            baseline = load_baseline(args.compare)
+        except (OSError, ValueError, KeyError) as e:
+            print(f"Error: Could not read baseline {args.compare}: {e}"); sys.exit(1)
+
+    cases = [(name, setup) for name, setup in get_benchmark_cases() if not args.name_filter or args.name_filter in name]
+    if not cases:
+        print(f"Error: No benchmark case matches '{args.name_filter}'."); sys.exit(1)
+
+    results = {}
+    regressions = []
+    for name, setup in cases:
+        seconds_per_call = time_case(setup(), max(1, args.repeat))
+        results[name] = seconds_per_call
+        line = f"{name:<40} {format_duration(seconds_per_call)}"
+        if name in baseline:
+            ratio = seconds_per_call / baseline[name]
+            line += f"  {ratio:5.2f}x baseline"
+            if ratio > 1.0 + args.tolerance:
+                line += "  REGRESSION"
+                regressions.append(name)
+        print(line, flush=True)
+
+    if args.save:
+        save_baseline(args.save, results)
+        print(f"Baseline saved to: {args.save}")
+    if regressions:
+        print(f"{len(regressions)} case(s) slower than the baseline by more than {args.tolerance:.0%}: {', '.join(regressions)}")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -1,27 +1,56 @@
 import argparse
+import asyncio
+import collections
+import concurrent.futures
+import contextlib
+import dataclasses
+import functools
+import hashlib
+import importlib
+import io
+import json
+import math
+import mmap
+import multiprocessing
+import os
+import queue
 import random
+import signal
+import struct
+import subprocess
+import tempfile
+import threading
 import time
 import sys
+import wave
 
-# Attempt to import required libraries and provide guidance if missing
-try:
-    import pyttsx3
-except ImportError:
-    print("ERROR: The 'pyttsx3' library is not installed. Please install it by running: pip install pyttsx3")
-    print("You may also need to install OS-specific text-to-speech engines.")
-    sys.exit(1)
-
-try:
-    import pygame
-except ImportError:
-    print("ERROR: The 'pygame' library is not installed. Please install it by running: pip install pygame")
-    sys.exit(1)
-
-try:
-    import numpy
-except ImportError:
-    print("ERROR: The 'numpy' library is not installed. Please install it by running: pip install numpy")
-    sys.exit(1)
+# pygame prints a banner to stdout on import, which would corrupt a raw PCM stream on stdout
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+
+class _DeferredImport:
+    """
+    Stands in for a heavy library until it is first used, so --help, argument errors and --dry-run
+    never load it. The first attribute access imports the library and replaces this placeholder in the
+    module globals, so later accesses cost nothing extra. A missing library raises RuntimeError with
+    install guidance (not SystemExit, so an application embedding a session keeps running).
+    """
+
+    def __init__(self, module_name, install_hint=None):
+        self._module_name = module_name
+        self._install_hint = install_hint
+
+    def __getattr__(self, attribute_name):
+        try:
+            module = importlib.import_module(self._module_name)
+        except ImportError:
+            message = f"ERROR: The '{self._module_name}' library is not installed. Please install it by running: pip install {self._module_name}"
+            raise RuntimeError(f"{message}\n{self._install_hint}" if self._install_hint else message) from None
+        globals()[self._module_name] = module
+        return getattr(module, attribute_name)
+
+pyttsx3 = _DeferredImport("pyttsx3", "You may also need to install OS-specific text-to-speech engines.")
+pygame = _DeferredImport("pygame")
+numpy = _DeferredImport("numpy")
 
 # --- Music Theory Constants ---
 # For parsing input root note names
@@ -60,18 +89,233 @@ A4_MIDI_NOTE = 69 # MIDI note number for A4
 TONE_DURATION_SEC = 0.5
 TONE_AMPLITUDE_FACTOR = 0.3
 SAMPLE_RATE = 44100
+WAVETABLE_BITS = 16 # The shared single-cycle sine table has 2**WAVETABLE_BITS samples (nearest-sample error < 1 LSB at 16 bits)
+WAVETABLE_SIZE = 1 << WAVETABLE_BITS
+OSCILLATOR_PHASE_BITS = 32 # Oscillator phase is a fixed-point fraction of a cycle with this many bits
+TONE_BANK_MAX_BYTES = 16 * 1024 * 1024 # Memory cap for cached tone sounds (LRU eviction beyond this)
+TTS_BACKENDS = ("pyttsx3", "espeak-ng", "fake")
+ESPEAK_NG_VOICE = "en"
+ESPEAK_NG_RATE = 175 # Words per minute
+ESPEAK_NG_POOL_SIZE = 4 # Warm espeak-ng processes kept waiting for text
+TTS_PRERENDER_WORKERS = min(4, os.cpu_count() or 1) # Processes used to pre-render pyttsx3 phrases (1 = serial)
+FAKE_TTS_BASE_SEC = 0.15 # Fake TTS: silence of BASE + PER_CHAR * len(text) seconds
+FAKE_TTS_SEC_PER_CHAR = 0.06
+SPEECH_CACHE_MAX_BYTES = 64 * 1024 * 1024 # Size limit for the on-disk speech cache (LRU eviction beyond this)
 NEW_ROOT_NOTE_ANNOUNCEMENT_DELAY_SEC = 2.0
+AUDIO_BACKENDS = ("pygame", "wav", "pcm", "null") # pygame plays live; the others render as fast as possible
+PLAYBACK_LOOKAHEAD_SEC = 3.0 # How far (s) the session loop may run ahead of live playback
+PLAYBACK_LATE_THRESHOLD_SEC = 0.02 # Events started later than this past their deadline count as late
+PCM_CHUNK_FRAMES = 4096 # Raw PCM output is written in chunks of this many frames (~93 ms, 8 KiB at 44100 Hz)
+PCM_STREAM_MAX_QUEUED_CHUNKS = 4 # iter_session_pcm(): rendered chunks waiting for the consumer before rendering pauses
+LATENCY_HISTOGRAM_MIN_SEC = 1e-6 # Stage histograms: log-spaced buckets from 1 us ...
+LATENCY_HISTOGRAM_DECADES = 8 # ... to 100 s (longer durations go in the last bucket)
+LATENCY_HISTOGRAM_BUCKETS_PER_DECADE = 20 # Percentiles are accurate to about +/-6%
+
+# --- File Helpers ---
+@contextlib.contextmanager
+def atomic_replace(path, shared=False):
+    """
+    Yields a temporary file path next to path; when the with block ends, the file written there is moved
+    over path in one rename, so readers see the old file or the whole new one, never a partial one.
+    If the block raises, the temporary file is removed. shared=True makes the file world-readable
+    (mkstemp files are private to the user).
+    """
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), suffix=".tmp")
+    os.close(fd)
+    try:
+        yield temp_path
+        if shared:
+            os.chmod(temp_path, 0o644)
+        os.replace(temp_path, path)
+    except BaseException:
+        with contextlib.suppress(OSError):
+            os.remove(temp_path)
+        raise
+
+# --- Latency Instrumentation ---
+class LatencyHistogram:
+    """
+    Durations of one stage in log-spaced buckets, so memory stays constant however long the session runs.
+    Count, total and max are exact; percentiles are read from the buckets (geometric bucket midpoint).
+    """
+
+    def __init__(self):
+        self.buckets = [0] * (LATENCY_HISTOGRAM_DECADES * LATENCY_HISTOGRAM_BUCKETS_PER_DECADE)
+        self.count = 0
+        self.total_sec = 0.0
+        self.max_sec = 0.0
+
+    def record(self, duration_sec):
+        if duration_sec > LATENCY_HISTOGRAM_MIN_SEC:
+            bucket = int(math.log10(duration_sec / LATENCY_HISTOGRAM_MIN_SEC) * LATENCY_HISTOGRAM_BUCKETS_PER_DECADE)
+            self.buckets[min(bucket, len(self.buckets) - 1)] += 1
+        else:
+            self.buckets[0] += 1
+        self.count += 1
+        self.total_sec += duration_sec
+        self.max_sec = max(self.max_sec, duration_sec)
+
+    def percentile(self, fraction):
+        """Returns the duration (s) below which the given fraction (0-1) of samples fall, or 0.0 if empty."""
+        if not self.count:
+            return 0.0
+        rank = max(1, math.ceil(fraction * self.count))
+        seen = 0
+        for bucket, bucket_count in enumerate(self.buckets):
+            seen += bucket_count
+            if seen >= rank:
+                break
+        midpoint_sec = LATENCY_HISTOGRAM_MIN_SEC * 10 ** ((bucket + 0.5) / LATENCY_HISTOGRAM_BUCKETS_PER_DECADE)
+        return min(midpoint_sec, self.max_sec)
+
+    def to_dict(self):
+        """Summary in milliseconds, plus the non-empty buckets keyed by their upper bound (ms)."""
+        return {
+            "count": self.count,
+            "total_ms": self.total_sec * 1000,
+            "mean_ms": self.total_sec * 1000 / self.count if self.count else 0.0,
+            "p50_ms": self.percentile(0.50) * 1000,
+            "p95_ms": self.percentile(0.95) * 1000,
+            "p99_ms": self.percentile(0.99) * 1000,
+            "max_ms": self.max_sec * 1000,
+            "buckets": {
+                f"{LATENCY_HISTOGRAM_MIN_SEC * 1000 * 10 ** ((bucket + 1) / LATENCY_HISTOGRAM_BUCKETS_PER_DECADE):.6g}": bucket_count
+                for bucket, bucket_count in enumerate(self.buckets) if bucket_count
+            },
+        }
+
+class SessionTrace:
+    """
+    In-memory timeline of session events in Chrome Trace Event Format, for chrome://tracing or Perfetto.
+    Recording only appends a tuple (list.append is atomic, so threads need no lock); the JSON is built
+    in one pass by write_json(). Spans go on the recording thread's track, or on the "audio" track for
+    sounds, whose span covers the time the sound is heard.
+    """
+
+    AUDIO_TRACK_ID = 0 # Pseudo thread id for the audio track (real native thread ids are never 0)
+
+    def __init__(self):
+        self.start_time = time.perf_counter()
+        self._events = [] # (phase, name, start_sec, duration_sec, track_id, args)
+        self._track_names = {self.AUDIO_TRACK_ID: "audio"}
+
+    def _current_track(self):
+        track_id = threading.get_native_id()
+        if track_id not in self._track_names:
+            self._track_names[track_id] = threading.current_thread().name
+        return track_id
+
+    def add_span(self, name, start_time, duration_sec, args=None, on_audio_track=False):
+        """Adds a complete ("X") event; start_time is a time.perf_counter() value."""
+        track_id = self.AUDIO_TRACK_ID if on_audio_track else self._current_track()
+        self._events.append(("X", name, start_time - self.start_time, duration_sec, track_id, args))
+
+    def add_instant(self, name, args=None):
+        """Adds an instant ("i") event at the current time, e.g. a root change or an overrun."""
+        self._events.append(("i", name, time.perf_counter() - self.start_time, None, self._current_track(), args))
+
+    def write_json(self, json_path):
+        """Writes every event recorded so far, plus track names, as a trace JSON file."""
+        pid = os.getpid()
+        trace_events = [
+            {"name": "thread_name", "ph": "M", "pid": pid, "tid": track_id, "args": {"name": track_name}}
+            for track_id, track_name in list(self._track_names.items())
+        ]
+        for phase, name, start_sec, duration_sec, track_id, args in list(self._events):
+            trace_event = {"name": name, "ph": phase, "ts": start_sec * 1e6, "pid": pid, "tid": track_id}
+            if phase == "X":
+                trace_event["dur"] = duration_sec * 1e6
+            else:
+                trace_event["s"] = "t" # Instant events are scoped to their thread
+            if args:
+                trace_event["args"] = args
+            trace_events.append(trace_event)
+        with open(json_path, "w") as trace_file:
+            json.dump({"traceEvents": trace_events, "displayTimeUnit": "ms"}, trace_file)
+
+class StageMetrics:
+    """
+    Per-stage latency histograms for the session: selection, degree/note/announcement speech, tone synthesis,
+    make_sound, playback, sleep and root switch. Thread-safe, since the playback worker records its own stages.
+    With a SessionTrace attached, every measured stage is also added to the trace as a span.
+    Each session output owns one (output.metrics), shared with its tone/phrase banks and playback worker.
+    """
+
+    def __init__(self, trace=None):
+        self._lock = threading.Lock()
+        self._histograms = {} # stage name -> LatencyHistogram
+        self.trace = trace # Optional SessionTrace
+
+    def record(self, stage, duration_sec):
+        with self._lock:
+            histogram = self._histograms.get(stage)
+            if histogram is None:
+                histogram = self._histograms[stage] = LatencyHistogram()
+            histogram.record(duration_sec)
+
+    @contextlib.contextmanager
+    def measure(self, stage, **trace_args):
+        """Records the wall-clock time spent in the with block under stage; trace_args annotate the trace span."""
+        start_time = time.perf_counter()
+        try:
+            yield
+        finally:
+            duration_sec = time.perf_counter() - start_time
+            self.record(stage, duration_sec)
+            if self.trace is not None:
+                self.trace.add_span(stage, start_time, duration_sec, trace_args)
+
+    def mark(self, name, **trace_args):
+        """Adds an instant event to the trace, if one is attached (no histogram is kept)."""
+        if self.trace is not None:
+            self.trace.add_instant(name, trace_args)
+
+    def mark_audio(self, name, duration_sec, **trace_args):
+        """Adds a span on the trace's audio track for a sound that starts playing now and lasts duration_sec."""
+        if self.trace is not None:
+            self.trace.add_span(name, time.perf_counter(), duration_sec, trace_args, on_audio_track=True)
+
+    def reset(self):
+        with self._lock:
+            self._histograms.clear()
+
+    def to_dict(self):
+        with self._lock:
+            return {"stages": {stage: histogram.to_dict() for stage, histogram in sorted(self._histograms.items())}}
+
+    def write_json(self, json_path):
+        """Writes the current histograms to json_path, atomically replacing any earlier dump."""
+        metrics = self.to_dict()
+        with atomic_replace(json_path) as temp_path, open(temp_path, "w") as temp_file:
+            json.dump(metrics, temp_file, indent=2)
+
+def write_stage_metrics(metrics, json_path):
+    """Dumps a StageMetrics to json_path, reporting (not raising) write errors."""
+    try:
+        metrics.write_json(json_path)
+        print(f"Stage metrics written to: {json_path}")
+    except OSError as e:
+        print(f"Warning: Could not write stage metrics to {json_path}: {e}")
+
+def write_session_trace(trace, json_path):
+    """Writes a SessionTrace to json_path, reporting (not raising) write errors."""
+    try:
+        trace.write_json(json_path)
+        print(f"Session trace written to: {json_path}")
+    except OSError as e:
+        print(f"Warning: Could not write session trace to {json_path}: {e}")
 
 # --- Text-to-Speech Functions ---
 def initialize_tts_engine():
-    """Initializes and returns the text-to-speech engine."""
+    """Initializes and returns the text-to-speech engine. Raises RuntimeError if it cannot start."""
     try:
         engine = pyttsx3.init()
         return engine
+    except RuntimeError:
+        raise # pyttsx3 itself is missing; the message already says how to install it
     except Exception as e:
-        print(f"Error initializing text-to-speech engine: {e}\n"
-              "Ensure a compatible TTS engine is installed.")
-        sys.exit(1)
+        raise RuntimeError(f"Error initializing text-to-speech engine: {e}\n"
+                           "Ensure a compatible TTS engine is installed.")
 
 def speak_text(engine, text):
     """Uses the TTS engine to speak the given text."""
@@ -82,6 +326,335 @@ def speak_text(engine, text):
     engine.say(text)
     engine.runAndWait()
 
+def synthesize_speech_arrays(engine, texts, sample_rate=SAMPLE_RATE):
+    """
+    Renders each text to a mono int16 NumPy array at sample_rate via the TTS engine's save_to_file.
+    All texts are queued before a single runAndWait, so the engine's event loop only runs once.
+    Returns a dict of text -> array; texts that fail to synthesize map to an empty array.
+    """
+    temp_dir = tempfile.mkdtemp(prefix="scale_degree_tts_")
+    temp_wav_paths = {}
+    try:
+        for i, text in enumerate(texts):
+            temp_wav_paths[text] = os.path.join(temp_dir, f"phrase_{i}.wav")
+            engine.save_to_file(text, temp_wav_paths[text])
+        engine.runAndWait()
+
+        speech_arrays = {}
+        for text, temp_wav_path in temp_wav_paths.items():
+            try:
+                speech_arrays[text] = read_wav_as_mono_int16(temp_wav_path, sample_rate)
+            except Exception as e:
+                print(f"Error synthesizing speech for '{text}': {e}")
+                speech_arrays[text] = numpy.zeros(0, dtype=numpy.int16)
+        return speech_arrays
+    finally:
+        for temp_wav_path in temp_wav_paths.values():
+            if os.path.exists(temp_wav_path):
+                os.remove(temp_wav_path)
+        os.rmdir(temp_dir)
+
+# Per-process pyttsx3 engine for parallel pre-rendering (pyttsx3 is not thread-safe, so each worker has its own)
+_prerender_worker_engine = None
+
+def _init_prerender_worker():
+    global _prerender_worker_engine
+    _prerender_worker_engine = pyttsx3.init()
+
+def _prerender_phrases_in_worker(task):
+    """Synthesizes a chunk of phrases and saves each to a .npy file in output_dir; returns {text: path}."""
+    texts, sample_rate, output_dir = task
+    speech_paths = {}
+    for text, speech in synthesize_speech_arrays(_prerender_worker_engine, texts, sample_rate).items():
+        fd, speech_path = tempfile.mkstemp(dir=output_dir, suffix=".npy")
+        with os.fdopen(fd, "wb") as speech_file:
+            numpy.save(speech_file, speech, allow_pickle=False)
+        speech_paths[text] = speech_path
+    return speech_paths
+
+def synthesize_speech_arrays_in_parallel(texts, sample_rate=SAMPLE_RATE, num_workers=TTS_PRERENDER_WORKERS):
+    """
+    Like synthesize_speech_arrays, but spreads the phrases over a pool of processes with one pyttsx3
+    engine each. Workers hand their audio back through .npy files in a shared temporary directory.
+    """
+    texts = list(texts)
+    num_workers = max(1, min(num_workers, len(texts)))
+    chunks = [texts[i::num_workers] for i in range(num_workers)] # Round-robin keeps chunk sizes even
+    speech_arrays = {}
+    with tempfile.TemporaryDirectory(prefix="scale_degree_tts_") as output_dir:
+        # spawn, not fork: TTS drivers may hold threads or OS handles that do not survive a fork
+        with multiprocessing.get_context("spawn").Pool(num_workers, initializer=_init_prerender_worker) as pool:
+            for speech_paths in pool.map(_prerender_phrases_in_worker, [(chunk, sample_rate, output_dir) for chunk in chunks]):
+                for text, speech_path in speech_paths.items():
+                    speech_arrays[text] = numpy.load(speech_path, allow_pickle=False)
+    return speech_arrays
+
+# TTS backends: synthesize(texts, sample_rate) returns {text: mono int16 array} and speak(text) talks
+# out loud, blocking until done. voice_id and speech_rate describe the output for the speech cache key.
+class Pyttsx3Backend:
+    """
+    Speech through pyttsx3; synthesis uses save_to_file batches.
+    Batches of more than one phrase are pre-rendered across prerender_workers processes in parallel.
+    The engine belongs to the thread that created it: synthesis requested from any other thread (e.g., the
+    playback worker's fallback) runs in a worker process instead.
+    """
+
+    name = "pyttsx3"
+
+    def __init__(self, prerender_workers=TTS_PRERENDER_WORKERS):
+        self.engine = initialize_tts_engine()
+        self._engine_thread_id = threading.get_ident()
+        self.prerender_workers = prerender_workers
+        self.voice_id = f"pyttsx3:{self.engine.getProperty('voice')}"
+        self.speech_rate = self.engine.getProperty("rate")
+
+    def synthesize(self, texts, sample_rate=SAMPLE_RATE):
+        # pyttsx3.init() hands every thread the same engine, so another thread cannot just make its own
+        off_engine_thread = threading.get_ident() != self._engine_thread_id
+        if off_engine_thread or (self.prerender_workers > 1 and len(texts) > 1):
+            try:
+                return synthesize_speech_arrays_in_parallel(texts, sample_rate, self.prerender_workers)
+            except Exception as e:
+                if off_engine_thread:
+                    print(f"Error synthesizing speech outside the TTS engine's thread: {e}")
+                    return {text: numpy.zeros(0, dtype=numpy.int16) for text in texts}
+                print(f"Warning: Parallel speech pre-rendering failed ({e}); synthesizing serially.")
+        return synthesize_speech_arrays(self.engine, texts, sample_rate)
+
+    def speak(self, text):
+        speak_text(self.engine, text)
+
+    def close(self):
+        pass
+
+class EspeakNgBackend:
+    """
+    Speech through espeak-ng subprocesses writing WAV to stdout.
+    A pool of processes is started ahead of time and left waiting on stdin, so their startup and voice
+    loading is already done when text arrives. Each process speaks one batch of text and is replaced
+    by a fresh one straight away; a batch of phrases is spread across every warm process in parallel.
+    speak() waits for the speech to be heard on clock (a RealClock unless given).
+    """
+
+    name = "espeak-ng"
+
+    def __init__(self, voice=ESPEAK_NG_VOICE, rate=ESPEAK_NG_RATE, pool_size=ESPEAK_NG_POOL_SIZE, executable="espeak-ng",
+                 clock=None):
+        self.clock = clock if clock is not None else RealClock()
+        self.voice = voice
+        self.rate = rate
+        self.pool_size = max(1, pool_size)
+        self.executable = executable
+        self.voice_id = f"espeak-ng:{voice}"
+        self.speech_rate = rate
+        self._idle_processes = collections.deque()
+        self._lock = threading.Lock()
+        self._refill_pool()
+
+    def _spawn(self):
+        return subprocess.Popen(
+            [self.executable, "--stdout", "-v", self.voice, "-s", str(self.rate)],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+        )
+
+    def _refill_pool(self):
+        with self._lock:
+            while len(self._idle_processes) < self.pool_size:
+                self._idle_processes.append(self._spawn())
+
+    def _take_process(self):
+        with self._lock:
+            process = self._idle_processes.popleft() if self._idle_processes else self._spawn()
+            self._idle_processes.append(self._spawn()) # Replace it so the pool stays warm
+        return process
+
+    def synthesize(self, texts, sample_rate=SAMPLE_RATE):
+        speech_arrays = {}
+        texts = list(texts)
+        for batch_start in range(0, len(texts), self.pool_size):
+            batch = texts[batch_start:batch_start + self.pool_size]
+            running = []
+            for text in batch: # Hand every text in the batch to its own warm process first...
+                process = self._take_process()
+                process.stdin.write(text.encode("utf-8") + b"\n")
+                process.stdin.close()
+                running.append((text, process))
+            for text, process in running: # ...then collect the WAV output from each
+                wav_bytes = process.stdout.read()
+                process.wait()
+                try:
+                    speech_arrays[text] = read_wav_as_mono_int16(io.BytesIO(wav_bytes), sample_rate)
+                except Exception as e:
+                    print(f"Error synthesizing speech for '{text}': {e}")
+                    speech_arrays[text] = numpy.zeros(0, dtype=numpy.int16)
+        return speech_arrays
+
+    def speak(self, text):
+        if not text or text.isspace():
+            print("Skipping empty text for speech.")
+            return
+        mixer_status = pygame.mixer.get_init()
+        if not mixer_status:
+            print("Error: Pygame mixer not initialized when trying to speak.")
+            return
+        # Synthesize on a warm pooled process (no per-utterance startup) and play through the mixer like every other sound
+        mixer_frequency, mixer_format, mixer_channels = mixer_status
+        speech = self.synthesize([text], mixer_frequency)[text]
+        samples = expand_to_channels(convert_int16_samples(speech, mixer_format), mixer_channels)
+        sound = pygame.sndarray.make_sound(samples)
+        print(f"Speaking: {text}")
+        sound.play()
+        self.clock.sleep_blocking(sound.get_length()) # speak() blocks until the speech has been heard
+
+    def close(self):
+        with self._lock:
+            while self._idle_processes:
+                process = self._idle_processes.popleft()
+                process.kill()
+                process.wait()
+
+class FakeTtsBackend:
+    """
+    Silent stand-in for CI and benchmarks: 'speech' is silence whose length grows with the text.
+    speak() takes that long on clock (a RealClock unless given).
+    """
+
+    name = "fake"
+    voice_id = "fake"
+    speech_rate = 0
+
+    def __init__(self, clock=None):
+        self.clock = clock if clock is not None else RealClock()
+
+    def synthesize(self, texts, sample_rate=SAMPLE_RATE):
+        return {text: numpy.zeros(int(self.speech_duration_sec(text) * sample_rate), dtype=numpy.int16)
+                for text in texts}
+
+    def speech_duration_sec(self, text):
+        return FAKE_TTS_BASE_SEC + FAKE_TTS_SEC_PER_CHAR * len(text.strip())
+
+    def speak(self, text):
+        if not text or text.isspace():
+            print("Skipping empty text for speech.")
+            return
+        print(f"Speaking: {text}")
+        self.clock.sleep_blocking(self.speech_duration_sec(text))
+
+    def close(self):
+        pass
+
+def initialize_tts_backend(backend_name, prerender_workers=TTS_PRERENDER_WORKERS):
+    """Creates the named TTS backend (one of TTS_BACKENDS). Raises RuntimeError if it cannot start."""
+    if backend_name == "pyttsx3":
+        return Pyttsx3Backend(prerender_workers)
+    if backend_name == "espeak-ng":
+        try:
+            return EspeakNgBackend()
+        except OSError as e:
+            raise RuntimeError(f"Error starting espeak-ng: {e}\nInstall espeak-ng or choose another --tts_backend.")
+    if backend_name == "fake":
+        return FakeTtsBackend()
+    raise RuntimeError(f"Error: Unknown TTS backend '{backend_name}'. Valid options: {', '.join(TTS_BACKENDS)}")
+
+class SpeechDiskCache:
+    """
+    Content-addressed on-disk cache of synthesized speech, so restarts skip the TTS engine.
+    Entries are keyed by phrase text, voice id, speech rate and sample rate and stored as .npy files.
+    Writes are atomic (temp file + rename); a file's mtime records its last use, and the least
+    recently used entries are deleted once the cache grows past max_bytes.
+    """
+
+    def __init__(self, cache_dir, voice_id, speech_rate, sample_rate=SAMPLE_RATE, max_bytes=SPEECH_CACHE_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.voice_id = voice_id
+        self.speech_rate = speech_rate
+        self.sample_rate = sample_rate
+        self.max_bytes = max_bytes
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _entry_path(self, text):
+        key_material = json.dumps([text, str(self.voice_id), str(self.speech_rate), self.sample_rate])
+        digest = hashlib.sha256(key_material.encode("utf-8")).hexdigest()
+        return os.path.join(self.cache_dir, f"{digest}.npy")
+
+    def get(self, text):
+        """Returns the cached int16 array for text, or None on a miss or unreadable entry (corrupt ones are removed)."""
+        entry_path = self._entry_path(text)
+        try:
+            speech = numpy.load(entry_path, allow_pickle=False)
+            os.utime(entry_path) # Mark as recently used
+            return speech
+        except OSError:
+            return None
+        except (ValueError, EOFError): # Truncated or corrupt (numpy raises EOFError for an empty file)
+            with contextlib.suppress(OSError):
+                os.remove(entry_path)
+            return None
+
+    def put(self, text, speech):
+        """Stores speech for text atomically, then evicts old entries if over the size limit."""
+        try:
+            with atomic_replace(self._entry_path(text)) as temp_path, open(temp_path, "wb") as temp_file:
+                numpy.save(temp_file, speech, allow_pickle=False)
+        except OSError as e:
+            print(f"Warning: Could not write speech cache entry for '{text}': {e}")
+            return
+        self.evict()
+
+    def evict(self):
+        """Deletes least recently used entries until the cache fits in max_bytes."""
+        entries = []
+        for entry in os.scandir(self.cache_dir):
+            if entry.name.endswith(".npy"):
+                entry_stat = entry.stat()
+                entries.append((entry_stat.st_mtime, entry_stat.st_size, entry.path))
+        total_bytes = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total_bytes <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+                total_bytes -= size
+            except OSError:
+                pass # Already removed by another process
+
+def open_speech_disk_cache(cache_dir, tts_backend, sample_rate=SAMPLE_RATE):
+    """Creates a SpeechDiskCache keyed by the backend's voice and rate, or returns None if unavailable."""
+    try:
+        return SpeechDiskCache(cache_dir, tts_backend.voice_id, tts_backend.speech_rate, sample_rate)
+    except Exception as e:
+        print(f"Warning: Speech cache disabled, could not open '{cache_dir}': {e}")
+        return None
+
+def read_wav_as_mono_int16(wav_source, sample_rate=SAMPLE_RATE):
+    """Reads a PCM WAV file (path or binary file object) and returns it as a mono int16 array, resampled to sample_rate if needed."""
+    with wave.open(wav_source, "rb") as wav_file:
+        num_channels = wav_file.getnchannels()
+        sample_width = wav_file.getsampwidth()
+        source_rate = wav_file.getframerate()
+        raw_frames = wav_file.readframes(wav_file.getnframes())
+
+    if sample_width == 1: # 8-bit WAV is unsigned
+        samples = (numpy.frombuffer(raw_frames, dtype=numpy.uint8).astype(numpy.int16) - 128) << 8
+    elif sample_width == 2:
+        samples = numpy.frombuffer(raw_frames, dtype="<i2")
+    elif sample_width == 4:
+        samples = (numpy.frombuffer(raw_frames, dtype="<i4") >> 16).astype(numpy.int16)
+    else:
+        raise ValueError(f"Unsupported WAV sample width: {sample_width} bytes")
+
+    if num_channels > 1: # Downmix to mono
+        samples = samples.reshape(-1, num_channels).mean(axis=1)
+    return resample_int16(samples, source_rate, sample_rate)
+
+def resample_int16(samples, source_rate, sample_rate):
+    """Returns mono samples as int16 at sample_rate (linear interpolation); int16 input at the same rate is returned as-is."""
+    if source_rate != sample_rate and len(samples) > 0: # Linear-interpolation resample
+        num_output_samples = int(len(samples) * sample_rate / source_rate)
+        source_positions = numpy.arange(num_output_samples) * (source_rate / sample_rate)
+        samples = numpy.interp(source_positions, numpy.arange(len(samples)), samples)
+    return numpy.asarray(samples).astype(numpy.int16, copy=False)
+
 # --- Tone Generation and Music Logic Functions ---
 def normalize_degree_string(degree_str):
     """Converts various degree inputs to a standard internal format (e.g., 'flat 3' -> 'B3', '9' -> '9')."""
@@ -157,23 +730,308 @@ def calculate_frequency_and_midi(root_note_midi, degree_interval_semitones):
     target_midi_note = root_note_midi + degree_interval_semitones
     if not (0 <= target_midi_note <= 127): # Check MIDI range
         print(f"Warning: Calculated MIDI note {target_midi_note} is out of standard range (0-127).")
-    frequency = A4_FREQ * (2 ** ((target_midi_note - A4_MIDI_NOTE) / 12.0))
+    frequency = midi_note_to_frequency(target_midi_note)
     return frequency, target_midi_note
 
-def generate_sine_wave_array(frequency, duration_sec, num_channels=1):
-    """Generates a sine wave NumPy array, adaptable for mono or stereo."""
-    t = numpy.linspace(0, duration_sec, int(SAMPLE_RATE * duration_sec), endpoint=False)
-    wave_mono = numpy.sin(frequency * t * 2 * numpy.pi) # Mono wave
-    # Scale to 16-bit integer range and apply amplitude factor
-    audio_data_mono = (wave_mono * (2**15 - 1) * TONE_AMPLITUDE_FACTOR).astype(numpy.int16)
+def midi_note_to_frequency(midi_note_number):
+    """Converts a MIDI note number to its equal-tempered frequency in Hz."""
+    return A4_FREQ * (2 ** ((midi_note_number - A4_MIDI_NOTE) / 12.0))
+
+# Sample formats the pygame mixer can negotiate, by the format code from pygame.mixer.get_init():
+# numpy dtype (by name, so numpy is not needed at import), the value of a full-scale peak, and the
+# offset of silence (for unsigned formats). 32-bit mixers are left out on purpose: get_init() reports
+# both signed 32-bit integer and 32-bit float output as -32, so the sample type cannot be known.
+SampleFormat = collections.namedtuple("SampleFormat", "dtype full_scale offset")
+MIXER_SAMPLE_FORMATS = {
+    8: SampleFormat("uint8", 2**7 - 1, 2**7),
+    -8: SampleFormat("int8", 2**7 - 1, 0),
+    16: SampleFormat("uint16", 2**15 - 1, 2**15),
+    -16: SampleFormat("int16", 2**15 - 1, 0),
+}
+DEFAULT_MIXER_FORMAT = -16 # Signed 16-bit, what the mixer is asked for and what WAV/PCM output uses
+
+def get_sample_format(mixer_format):
+    """Returns the SampleFormat for a pygame mixer format code."""
+    try:
+        return MIXER_SAMPLE_FORMATS[mixer_format]
+    except KeyError:
+        raise ValueError(f"Unsupported mixer sample format: {mixer_format}")
+
+def convert_int16_samples(samples, mixer_format):
+    """Converts int16 samples (e.g., synthesized speech) to a mixer format; int16 input is returned as-is."""
+    if mixer_format == DEFAULT_MIXER_FORMAT:
+        return samples
+    sample_format = get_sample_format(mixer_format)
+    scaled = samples.astype(numpy.float32) * (sample_format.full_scale / (2**15 - 1))
+    if sample_format.offset:
+        scaled += sample_format.offset
+    return scaled.astype(sample_format.dtype)
 
-    if num_channels == 2: # If stereo output is needed
-        # Duplicate mono channel to create stereo
-        return numpy.ascontiguousarray(numpy.column_stack((audio_data_mono, audio_data_mono)))
+@functools.lru_cache(maxsize=None)
+def get_sine_wavetable():
+    """One cycle of a sine wave, WAVETABLE_SIZE samples."""
+    return numpy.sin(numpy.arange(WAVETABLE_SIZE) * (2 * numpy.pi / WAVETABLE_SIZE))
+
+@functools.lru_cache(maxsize=None)
+def get_scaled_wavetable(amplitude, mixer_format):
+    """
+    The sine wavetable scaled (and offset) to a mixer format at the given amplitude and stored in that
+    format's dtype, so oscillators copy samples out of it without any float math; shared by all oscillators.
+    """
+    sample_format = get_sample_format(mixer_format)
+    scaled = get_sine_wavetable() * (sample_format.full_scale * amplitude) + sample_format.offset
+    if numpy.dtype(sample_format.dtype).kind in "iu":
+        scaled = numpy.rint(scaled)
+    return scaled.astype(sample_format.dtype)
+
+class WavetableOscillator:
+    """
+    Sine oscillator that reads the shared sine wavetable with a fixed-point phase accumulator: each sample
+    is a few integer operations and one nearest-sample lookup, written straight in the output format.
+    Phase is kept between render() calls, so a tone can be produced in consecutive chunks without clicks.
+    Scratch arrays are kept between calls and only grow, so rendering into a caller's buffer allocates
+    nothing once the oscillator has rendered a chunk of that size.
+    """
+
+    def __init__(self, frequency, amplitude=TONE_AMPLITUDE_FACTOR, sample_rate=SAMPLE_RATE, phase=0.0,
+                 mixer_format=DEFAULT_MIXER_FORMAT):
+        self.sample_rate = sample_rate
+        self.sample_format = get_sample_format(mixer_format)
+        self._scaled_table = get_scaled_wavetable(amplitude, mixer_format)
+        self._capacity = 0
+        self.retune(frequency, phase)
+
+    def retune(self, frequency, phase=0.0):
+        """Switches to a new frequency, restarting at the given phase (a fraction of a cycle); scratch space is kept."""
+        self.frequency = frequency
+        # Phase and increment are fractions of a cycle in OSCILLATOR_PHASE_BITS fixed point; the top
+        # WAVETABLE_BITS of the phase are the table index
+        self.phase = int(phase * (1 << OSCILLATOR_PHASE_BITS)) % (1 << OSCILLATOR_PHASE_BITS)
+        self.phase_increment = int(round(frequency * (1 << OSCILLATOR_PHASE_BITS) / self.sample_rate))
+
+    def _ensure_capacity(self, num_samples):
+        if num_samples <= self._capacity:
+            return
+        self._ramp = numpy.arange(num_samples, dtype=numpy.intp)
+        self._indices = numpy.empty(num_samples, dtype=numpy.intp)
+        self._samples = numpy.empty(num_samples, dtype=self._scaled_table.dtype) # Mono, for interleaved output
+        self._capacity = num_samples
+
+    def render(self, num_samples, out=None):
+        """
+        Renders the next num_samples in the oscillator's sample format and advances the phase.
+        Writes into out if given, a (num_samples,) or interleaved (num_samples, channels) array; every channel
+        gets the same signal. Returns out, or a new mono array if out is None.
+        """
+        if out is None:
+            out = numpy.empty(num_samples, dtype=self.sample_format.dtype)
+        self._ensure_capacity(num_samples)
+        indices = self._indices[:num_samples]
+        table = self._scaled_table
+
+        # Phase of every sample; bits above OSCILLATOR_PHASE_BITS are whole cycles and get masked off.
+        # Adding half a table step makes the truncating shift round to the nearest table sample.
+        numpy.multiply(self._ramp[:num_samples], self.phase_increment, out=indices)
+        indices += self.phase + (1 << (OSCILLATOR_PHASE_BITS - WAVETABLE_BITS - 1))
+        numpy.right_shift(indices, OSCILLATOR_PHASE_BITS - WAVETABLE_BITS, out=indices)
+        numpy.bitwise_and(indices, WAVETABLE_SIZE - 1, out=indices)
+        self.phase = (self.phase + self.phase_increment * num_samples) % (1 << OSCILLATOR_PHASE_BITS)
+
+        # mode="clip" lets take() write into out directly (the default "raise" buffers it); indices are always in range
+        if out.ndim == 1 and out.dtype == table.dtype:
+            numpy.take(table, indices, out=out, mode="clip")
+            return out
+        samples = self._samples[:num_samples]
+        numpy.take(table, indices, out=samples, mode="clip")
+        # Broadcasting writes the mono signal straight into every channel of an interleaved buffer
+        numpy.copyto(out, samples[:, numpy.newaxis] if out.ndim == 2 else samples, casting="unsafe")
+        return out
+
+class ToneRenderer:
+    """
+    Renders whole tones into reusable buffers for one output configuration: one oscillator's scratch space
+    plus a pool of output buffers keyed by length. A returned buffer is overwritten by the next render of
+    the same length, so copy it (e.g., into a pygame Sound or a sink) before rendering again.
+    """
+
+    def __init__(self, num_channels=1, amplitude=TONE_AMPLITUDE_FACTOR, sample_rate=SAMPLE_RATE,
+                 mixer_format=DEFAULT_MIXER_FORMAT):
+        self.num_channels = num_channels
+        self.sample_rate = sample_rate
+        self.oscillator = WavetableOscillator(0.0, amplitude, sample_rate, mixer_format=mixer_format)
+        self._buffers = {} # num_samples -> output buffer
+
+    def render(self, frequency, duration_sec):
+        num_samples = int(self.sample_rate * duration_sec)
+        buffer = self._buffers.get(num_samples)
+        if buffer is None:
+            shape = (num_samples, self.num_channels) if self.num_channels > 1 else (num_samples,)
+            buffer = numpy.empty(shape, dtype=self.oscillator.sample_format.dtype)
+            self._buffers[num_samples] = buffer
+        self.oscillator.retune(frequency)
+        return self.oscillator.render(num_samples, out=buffer)
+
+_thread_tone_renderers = threading.local() # .by_config: (num_channels, sample_rate, mixer_format, amplitude) -> ToneRenderer
+
+def get_tone_renderer(num_channels, sample_rate, mixer_format, amplitude=TONE_AMPLITUDE_FACTOR):
+    """
+    The calling thread's ToneRenderer for an output configuration, so one-off tones reuse its buffers.
+    Renderers keep phase and scratch state between calls, so each thread gets its own.
+    """
+    renderers = getattr(_thread_tone_renderers, "by_config", None)
+    if renderers is None:
+        renderers = _thread_tone_renderers.by_config = {}
+    key = (num_channels, sample_rate, mixer_format, amplitude)
+    renderer = renderers.get(key)
+    if renderer is None:
+        renderer = renderers[key] = ToneRenderer(num_channels, amplitude, sample_rate=sample_rate, mixer_format=mixer_format)
+    return renderer
+
+def generate_sine_wave_array(frequency, duration_sec, num_channels=1, amplitude=TONE_AMPLITUDE_FACTOR,
+                             sample_rate=SAMPLE_RATE, mixer_format=DEFAULT_MIXER_FORMAT):
+    """Generates a sine wave NumPy array in the given mixer format (int16 by default), adaptable for any channel count."""
+    num_samples = int(sample_rate * duration_sec)
+    shape = (num_samples, num_channels) if num_channels > 1 else (num_samples,)
+    # This thread's renderer's oscillator keeps its scratch space between calls; only the returned array is new
+    oscillator = get_tone_renderer(num_channels, sample_rate, mixer_format, amplitude).oscillator
+    oscillator.retune(frequency)
+    # Multichannel samples are written interleaved in one pass, without a mono intermediate copy
+    return oscillator.render(num_samples, out=numpy.empty(shape, dtype=oscillator.sample_format.dtype))
+
+def expand_to_channels(audio_data_mono, num_channels):
+    """Returns a mono array as-is, or copied once into a contiguous interleaved (samples, channels) array."""
+    if num_channels > 1: # If stereo (or more) output is needed
+        interleaved = numpy.empty((len(audio_data_mono), num_channels), dtype=audio_data_mono.dtype)
+        numpy.copyto(interleaved, audio_data_mono[:, numpy.newaxis]) # Broadcast into every channel
+        return interleaved
     return audio_data_mono # Return mono array
 
-def play_generated_tone(frequency, duration_sec):
-    """Plays a tone of a given frequency and duration using pygame."""
+class ToneBank:
+    """
+    Memoized, ready-to-play pygame Sounds keyed by MIDI note (0-127).
+    All sounds share one duration, amplitude, channel count, sample rate and mixer format, so a bank
+    belongs to one mixer configuration (see for_mixer()); the least recently used sounds are evicted
+    once the cached sample data exceeds max_bytes. With a matching SharedToneTable, sounds are made from
+    its samples instead of being synthesized. Synthesis and make_sound times are recorded in metrics.
+    """
+
+    def __init__(self, duration_sec, num_channels=1, amplitude=TONE_AMPLITUDE_FACTOR,
+                 sample_rate=SAMPLE_RATE, max_bytes=TONE_BANK_MAX_BYTES, mixer_format=DEFAULT_MIXER_FORMAT,
+                 shared_tones=None, metrics=None):
+        self.metrics = metrics if metrics is not None else StageMetrics()
+        self.duration_sec = duration_sec
+        self.num_channels = num_channels
+        self.amplitude = amplitude
+        self.sample_rate = sample_rate
+        self.mixer_format = mixer_format
+        self._renderer = ToneRenderer(num_channels, amplitude, sample_rate, mixer_format)
+        self._shared_tones = shared_tones if shared_tones is not None and shared_tones.matches(duration_sec, sample_rate) else None
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        self._sounds = collections.OrderedDict() # midi_note -> (sound, nbytes), oldest first
+
+    @classmethod
+    def for_mixer(cls, duration_sec, **kwargs):
+        """Creates a bank matching the negotiated pygame mixer (frequency, format, channels)."""
+        frequency, mixer_format, num_channels = pygame.mixer.get_init()
+        return cls(duration_sec, num_channels=num_channels, sample_rate=frequency, mixer_format=mixer_format, **kwargs)
+
+    def __len__(self):
+        return len(self._sounds)
+
+    def get_sound(self, midi_note_number):
+        """Returns the Sound for a MIDI note, rendering and caching it on first use."""
+        if not (0 <= midi_note_number <= 127):
+            raise ValueError(f"MIDI note {midi_note_number} is outside the tone bank range (0-127).")
+        cached = self._sounds.get(midi_note_number)
+        if cached is not None:
+            self._sounds.move_to_end(midi_note_number)
+            return cached[0]
+
+        if self._shared_tones is not None:
+            shared_samples = convert_int16_samples(self._shared_tones.get_samples(midi_note_number), self.mixer_format)
+            wave_array = expand_to_channels(shared_samples, self.num_channels)
+        else:
+            # The renderer's buffer is reused; make_sound copies it into the Sound
+            with self.metrics.measure("tone_synthesis"):
+                wave_array = self._renderer.render(midi_note_to_frequency(midi_note_number), self.duration_sec)
+        with self.metrics.measure("make_sound"):
+            sound = pygame.sndarray.make_sound(wave_array)
+        self._sounds[midi_note_number] = (sound, wave_array.nbytes)
+        self.total_bytes += wave_array.nbytes
+        # Evict least recently used sounds, but always keep the one just rendered
+        while self.total_bytes > self.max_bytes and len(self._sounds) > 1:
+            _, (_, evicted_nbytes) = self._sounds.popitem(last=False)
+            self.total_bytes -= evicted_nbytes
+        return sound
+
+    def prerender(self, midi_note_numbers):
+        """Renders the given MIDI notes ahead of time (out-of-range notes are skipped)."""
+        for midi_note_number in midi_note_numbers:
+            if 0 <= midi_note_number <= 127:
+                self.get_sound(midi_note_number)
+
+class SharedToneTable:
+    """
+    Mono int16 renders of every MIDI note (0-127) for one tone duration, sample rate and amplitude, kept in
+    a .npy file that session processes memory-map read-only. The OS page cache holds one copy for every
+    process, so tones are synthesized once per machine instead of once per process, and get_samples()
+    returns zero-copy views into the mapping.
+    """
+
+    def __init__(self, table_path, duration_sec, sample_rate):
+        self.table_path = table_path
+        self.duration_sec = duration_sec
+        self.sample_rate = sample_rate
+        self._table = numpy.load(table_path, mmap_mode="r")
+        if self._table.shape != (128, int(sample_rate * duration_sec)) or self._table.dtype != numpy.int16:
+            raise ValueError(f"{table_path} is not a tone table for {duration_sec}s tones at {sample_rate} Hz")
+
+    @classmethod
+    def open(cls, directory, duration_sec=TONE_DURATION_SEC, sample_rate=SAMPLE_RATE, amplitude=TONE_AMPLITUDE_FACTOR,
+             metrics=None):
+        """Maps the table for these settings from directory, building it first (timed in metrics) if no process has yet."""
+        # The file name carries the settings, so tables for different configurations live side by side
+        table_path = os.path.join(directory, f"tones-{sample_rate}hz-{duration_sec}s-amp{amplitude}.npy")
+        if not os.path.exists(table_path):
+            cls.build(table_path, duration_sec, sample_rate, amplitude, metrics)
+        return cls(table_path, duration_sec, sample_rate)
+
+    @staticmethod
+    def build(table_path, duration_sec=TONE_DURATION_SEC, sample_rate=SAMPLE_RATE, amplitude=TONE_AMPLITUDE_FACTOR,
+              metrics=None):
+        """
+        Renders all 128 notes straight into a new memory-mapped file and moves it into place atomically,
+        so processes building the same table at once never see a partial file (the last one wins).
+        """
+        metrics = metrics if metrics is not None else StageMetrics()
+        os.makedirs(os.path.dirname(os.path.abspath(table_path)), exist_ok=True)
+        with atomic_replace(table_path, shared=True) as temp_path: # The table is meant to be shared
+            num_samples = int(sample_rate * duration_sec)
+            table = numpy.lib.format.open_memmap(temp_path, mode="w+", dtype=numpy.int16, shape=(128, num_samples))
+            oscillator = WavetableOscillator(0.0, amplitude, sample_rate)
+            for midi_note_number in range(128):
+                oscillator.retune(midi_note_to_frequency(midi_note_number))
+                with metrics.measure("tone_synthesis"):
+                    oscillator.render(num_samples, out=table[midi_note_number])
+            table.flush()
+            del table # Unmap before the rename (required on Windows)
+
+    def matches(self, duration_sec, sample_rate):
+        return duration_sec == self.duration_sec and sample_rate == self.sample_rate
+
+    def get_samples(self, midi_note_number):
+        """Returns a read-only int16 view of a note's tone; no samples are copied."""
+        return self._table[midi_note_number]
+
+def play_generated_tone(frequency, duration_sec, tone_bank=None, midi_note_number=None, metrics=None):
+    """
+    Starts a tone of a given frequency and duration using pygame and returns without waiting for it to end;
+    the caller's clock decides when the next event starts.
+    If a tone bank and an in-range MIDI note are given, the cached Sound is played instead of synthesizing.
+    Synthesis, make_sound and the tone itself are recorded in metrics (a StageMetrics), if given.
+    """
+    metrics = metrics if metrics is not None else StageMetrics()
     if frequency is None:
         print("Skipping tone generation (invalid frequency).")
         return
@@ -185,62 +1043,1662 @@ def play_generated_tone(frequency, duration_sec):
             print("Error: Pygame mixer not initialized when trying to play tone.")
             return
 
-        mixer_channels = mixer_status[2] # Actual number of channels mixer is using
-        wave_array = generate_sine_wave_array(frequency, duration_sec, num_channels=mixer_channels)
-        
-        sound = pygame.sndarray.make_sound(wave_array)
+        if tone_bank is not None and midi_note_number is not None and 0 <= midi_note_number <= 127:
+            sound = tone_bank.get_sound(midi_note_number)
+        else:
+            # Render at the rate, format and channel count the mixer actually negotiated
+            mixer_frequency, mixer_format, mixer_channels = mixer_status
+            renderer = get_tone_renderer(mixer_channels, mixer_frequency, mixer_format)
+            with metrics.measure("tone_synthesis"):
+                wave_array = renderer.render(frequency, duration_sec)
+            with metrics.measure("make_sound"):
+                sound = pygame.sndarray.make_sound(wave_array)
         sound.play()
-        pygame.time.wait(int(duration_sec * 1000))  # Wait for sound to finish
+        metrics.mark_audio(f"tone {frequency:.2f} Hz", duration_sec, midi_note=midi_note_number)
     except Exception as e:
         print(f"Error playing tone: {e}")
 
-def activate_root_note(root_note_name, octave, tts_engine, unique_elements_ref):
-    """Announces new root note, calculates its root MIDI, and resets play counts."""
-    speak_text(tts_engine, f"New Root Note: {root_note_name}") 
-    time.sleep(NEW_ROOT_NOTE_ANNOUNCEMENT_DELAY_SEC)
-    
+def get_root_announcement_text(root_note_name):
+    """Returns the phrase spoken when a root note becomes active."""
+    return f"New Root Note: {root_note_name}"
+
+def get_session_phrases(unique_elements, root_notes):
+    """Returns every phrase a session can speak: degree names, note names and root announcements."""
+    phrases = [get_speakable_degree_name(el) for el in unique_elements]
+    phrases += SHARP_NOTE_NAMES + FLAT_NOTE_NAMES
+    phrases += [get_root_announcement_text(rn) for rn in root_notes]
+    # Drop duplicates and blanks, keeping first-seen order
+    return [phrase for phrase in dict.fromkeys(phrases) if phrase and not phrase.isspace()]
+
+class PhraseBank:
+    """
+    Speech for a known set of phrases, synthesized once to int16 arrays at the output sample rate.
+    With a disk cache, phrases synthesized by earlier runs are loaded instead of re-synthesized.
+    get_sound() wraps a phrase as a pygame Sound (created on first use) so it can be played through the mixer.
+    """
+
+    def __init__(self, tts_backend, num_channels=1, sample_rate=SAMPLE_RATE, disk_cache=None,
+                 mixer_format=DEFAULT_MIXER_FORMAT, metrics=None):
+        self.metrics = metrics if metrics is not None else StageMetrics()
+        self.tts_backend = tts_backend
+        self.num_channels = num_channels
+        self.sample_rate = sample_rate
+        self.mixer_format = mixer_format
+        self.disk_cache = disk_cache
+        self._arrays = {} # text -> mono int16 array
+        self._sounds = {} # text -> pygame Sound
+
+    def __len__(self):
+        return len(self._arrays)
+
+    def __contains__(self, text):
+        return text in self._arrays
+
+    def prerender(self, phrases):
+        """Synthesizes every phrase not already in the bank in one TTS batch."""
+        missing_phrases = [phrase for phrase in phrases if phrase not in self._arrays]
+        if self.disk_cache is not None:
+            for phrase in missing_phrases:
+                cached_speech = self.disk_cache.get(phrase)
+                if cached_speech is not None:
+                    self._arrays[phrase] = cached_speech
+            missing_phrases = [phrase for phrase in missing_phrases if phrase not in self._arrays]
+        if missing_phrases:
+            synthesized = self.tts_backend.synthesize(missing_phrases, self.sample_rate)
+            self._arrays.update(synthesized)
+            if self.disk_cache is not None:
+                for phrase, speech in synthesized.items():
+                    if len(speech) > 0: # Don't persist failed syntheses
+                        self.disk_cache.put(phrase, speech)
+
+    def get_array(self, text):
+        """Returns the mono int16 speech for text, synthesizing it now if it was not pre-rendered."""
+        if text not in self._arrays:
+            self.prerender([text])
+        return self._arrays[text]
+
+    def get_sound(self, text):
+        """Returns a pygame Sound for a pre-rendered phrase, or None if the phrase is unknown or empty."""
+        sound = self._sounds.get(text)
+        if sound is None:
+            speech = self._arrays.get(text)
+            if speech is None or len(speech) == 0:
+                return None
+            with self.metrics.measure("make_sound"):
+                mixer_speech = convert_int16_samples(speech, self.mixer_format)
+                sound = pygame.sndarray.make_sound(expand_to_channels(mixer_speech, self.num_channels))
+            self._sounds[text] = sound
+        return sound
+
+def calculate_root_midi_note(root_note_name, octave):
+    """Returns the MIDI note number of a root note name in the given octave."""
     # Use uppercase for dictionary lookup of semitone offset
-    root_note_semitone_offset = ROOT_NOTES_SEMITONES_FROM_C[root_note_name.upper()] 
+    root_note_semitone_offset = ROOT_NOTES_SEMITONES_FROM_C[root_note_name.upper()]
     # Calculate the MIDI note for the root in the specified octave
     # MIDI C0=12, C1=24, ... C4 (Middle C)=60. Formula: (octave + 1) * 12
-    current_root_midi_note = (octave + 1) * 12 + root_note_semitone_offset
-    
-    print(f"Activated Root Note: {root_note_name} (Octave {octave}). Root MIDI: {current_root_midi_note}")
-    
-    # Reset play counts for each unique element for this new root note session
-    element_play_counts = {el: 0 for el in unique_elements_ref}
-    return current_root_midi_note, element_play_counts
+    return (octave + 1) * 12 + root_note_semitone_offset
+
+
+def get_session_midi_notes(root_notes, unique_elements, octave):
+    """Returns the sorted set of MIDI notes a session over these root notes and elements can play."""
+    session_midi_notes = set()
+    for root_note_name in root_notes:
+        root_midi = calculate_root_midi_note(root_note_name, octave)
+        for el in unique_elements:
+            degree_interval = DEGREE_SEMITONE_INTERVALS.get(normalize_degree_string(el))
+            if degree_interval is not None:
+                session_midi_notes.add(root_midi + degree_interval)
+    return sorted(session_midi_notes)
+
+# Precomputed per-session lookups, so the practice loop only does indexed reads
+SessionRootEntry = collections.namedtuple("SessionRootEntry", "name midi_note announcement_text")
+SessionElementEntry = collections.namedtuple(
+    "SessionElementEntry", "element speakable_degree midi_note frequency note_name"
+)
+
+def compile_session_table(root_notes, unique_elements, octave):
+    """
+    Resolves every (root note, element) pair of a session once, at startup.
+    Returns (root_entries, element_entries) where element_entries[root_idx][element_idx] is a
+    SessionElementEntry; unrecognized degrees get None for midi_note, frequency and note_name.
+    The speakable degree and note name are also the phrase bank keys, and midi_note the tone bank key.
+    """
+    for el in unique_elements:
+        if normalize_degree_string(el) not in DEGREE_SEMITONE_INTERVALS:
+            print(f"Warning: Scale degree '{el}' (normalized to '{normalize_degree_string(el)}') not recognized in intervals dict.")
+
+    root_entries = []
+    element_entries = []
+    for root_note_name in root_notes:
+        root_midi_note = calculate_root_midi_note(root_note_name, octave)
+        root_entries.append(SessionRootEntry(root_note_name, root_midi_note, get_root_announcement_text(root_note_name)))
+        entries_for_root = []
+        for el in unique_elements:
+            degree_interval = DEGREE_SEMITONE_INTERVALS.get(normalize_degree_string(el))
+            frequency, midi_note, note_name = None, None, None
+            if degree_interval is not None:
+                frequency, midi_note = calculate_frequency_and_midi(root_midi_note, degree_interval)
+                note_name = get_note_name_from_midi(midi_note, root_note_name, el)
+            entries_for_root.append(SessionElementEntry(el, get_speakable_degree_name(el), midi_note, frequency, note_name))
+        element_entries.append(entries_for_root)
+    return root_entries, element_entries
+
+# --- Asset Packs ---
+# An asset pack is one file holding every tone and phrase a player needs, as s16le mono PCM:
+#   header: magic, format version, index length (ASSET_PACK_HEADER)
+#   index:  UTF-8 JSON with the sample rate, the voice that spoke the phrases, and [offset, frames] of
+#           every tone (by MIDI note and duration) and every phrase (by text); offsets are from file start
+#   blobs:  the PCM data, starting at an ASSET_PACK_ALIGNMENT boundary
+# Players mmap the file and read samples as zero-copy views, so startup needs no synthesis and no TTS engine.
+ASSET_PACK_MAGIC = b"SDSPACK\0"
+ASSET_PACK_VERSION = 1
+ASSET_PACK_HEADER = struct.Struct("<8sII") # magic, version, index length in bytes
+ASSET_PACK_ALIGNMENT = 64
+
+def get_asset_pack_phrases(elements=None, root_notes=None):
+    """
+    Phrases for an asset pack: the given degrees and root notes, or by default every supported degree
+    and every root note spelling (with a lowercase flat, e.g. "Bb"), plus all note names.
+    """
+    if elements is None:
+        elements = list(DEGREE_SEMITONE_INTERVALS)
+    if root_notes is None:
+        root_notes = [note_name[0] + note_name[1:].lower() for note_name in ROOT_NOTES_SEMITONES_FROM_C]
+    return get_session_phrases(elements, root_notes)
+
+def build_asset_pack(pack_path, tts_backend, phrases, sample_rate=SAMPLE_RATE, tone_durations=(TONE_DURATION_SEC,),
+                     amplitude=TONE_AMPLITUDE_FACTOR):
+    """
+    Writes an asset pack with all 128 MIDI tones at each duration and the given phrases spoken by tts_backend.
+    The pack is written under a temporary name and moved into place, so a running player never sees half of it.
+    Returns the number of bytes written.
+    """
+    speech_arrays = tts_backend.synthesize(phrases, sample_rate)
+    index = {"sample_rate": sample_rate, "voice_id": tts_backend.voice_id, "speech_rate": tts_backend.speech_rate,
+             "tones": [], "phrases": []}
+    # Lay out the blobs first: tone lengths are known up front and the phrases are already synthesized
+    blob_sizes = []
+    for duration_sec in tone_durations:
+        for midi_note_number in range(128):
+            index["tones"].append([midi_note_number, duration_sec, None, int(sample_rate * duration_sec)])
+            blob_sizes.append(int(sample_rate * duration_sec))
+    for phrase in phrases:
+        index["phrases"].append([phrase, None, len(speech_arrays[phrase])])
+        blob_sizes.append(len(speech_arrays[phrase]))
+    # Offsets depend on the index length, which depends on the offsets' digits: reserve room for the widest
+    index_length = len(json.dumps(index).encode("utf-8")) + 24 * len(blob_sizes)
+    data_start = -(-(ASSET_PACK_HEADER.size + index_length) // ASSET_PACK_ALIGNMENT) * ASSET_PACK_ALIGNMENT
+    offset = data_start
+    for entry in index["tones"] + index["phrases"]:
+        entry[-2] = offset
+        offset += entry[-1] * 2
+    index_bytes = json.dumps(index).encode("utf-8").ljust(data_start - ASSET_PACK_HEADER.size)
+
+    # Packs are meant to be shipped and shared, so the file is world-readable
+    with atomic_replace(pack_path, shared=True) as temp_path, open(temp_path, "wb") as pack_file:
+        pack_file.write(ASSET_PACK_HEADER.pack(ASSET_PACK_MAGIC, ASSET_PACK_VERSION, len(index_bytes)))
+        pack_file.write(index_bytes)
+        oscillator = WavetableOscillator(0.0, amplitude, sample_rate)
+        for midi_note_number, duration_sec, _, num_frames in index["tones"]:
+            oscillator.retune(midi_note_to_frequency(midi_note_number))
+            pack_file.write(oscillator.render(num_frames).astype("<i2", copy=False))
+        for phrase in phrases:
+            pack_file.write(speech_arrays[phrase].astype("<i2", copy=False))
+    return offset
+
+class AssetPack:
+    """
+    A memory-mapped asset pack (see build_asset_pack()). Tones and phrases are returned as read-only
+    int16 views into the mapping; nothing is read from disk until a sample is first touched.
+    Raises ValueError if the file is not an asset pack.
+    """
+
+    def __init__(self, pack_path):
+        self.pack_path = pack_path
+        with open(pack_path, "rb") as pack_file:
+            self._map = mmap.mmap(pack_file.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(self._map) < ASSET_PACK_HEADER.size:
+            raise ValueError(f"{pack_path} is not an asset pack")
+        magic, version, index_length = ASSET_PACK_HEADER.unpack_from(self._map)
+        if magic != ASSET_PACK_MAGIC or version != ASSET_PACK_VERSION:
+            raise ValueError(f"{pack_path} is not an asset pack (or an unsupported version)")
+        index = json.loads(bytes(self._map[ASSET_PACK_HEADER.size:ASSET_PACK_HEADER.size + index_length]))
+        self.sample_rate = index["sample_rate"]
+        self.voice_id = index["voice_id"]
+        self.speech_rate = index["speech_rate"]
+        self._tones = {(midi_note_number, duration_sec): (offset, num_frames)
+                       for midi_note_number, duration_sec, offset, num_frames in index["tones"]}
+        self._phrases = {phrase: (offset, num_frames) for phrase, offset, num_frames in index["phrases"]}
+        self.tone_durations = sorted({duration_sec for _, duration_sec in self._tones})
+
+    def __contains__(self, phrase):
+        return phrase in self._phrases
+
+    def _view(self, offset, num_frames):
+        return numpy.frombuffer(self._map, dtype="<i2", count=num_frames, offset=offset)
+
+    def get_phrase(self, phrase):
+        """Returns the phrase's speech as a zero-copy int16 view, or None if the pack does not have it."""
+        location = self._phrases.get(phrase)
+        return self._view(*location) if location is not None else None
+
+    def phrase_duration_sec(self, phrase):
+        """Returns the length (s) of the phrase's speech, or None if the pack does not have it; reads no samples."""
+        location = self._phrases.get(phrase)
+        return location[1] / self.sample_rate if location is not None else None
+
+    def get_tone(self, midi_note_number, duration_sec):
+        """Returns the tone as a zero-copy int16 view, or None if the pack does not have it."""
+        location = self._tones.get((midi_note_number, duration_sec))
+        return self._view(*location) if location is not None else None
+
+    def tone_table(self, duration_sec):
+        """The pack's tones of one duration, usable wherever a SharedToneTable is, or None if it has none."""
+        return PackedToneTable(self, duration_sec) if duration_sec in self.tone_durations else None
+
+class PackedToneTable:
+    """SharedToneTable interface (matches(), get_samples()) over one tone duration of an AssetPack."""
+
+    def __init__(self, asset_pack, duration_sec):
+        self.asset_pack = asset_pack
+        self.duration_sec = duration_sec
+        self.sample_rate = asset_pack.sample_rate
+
+    def matches(self, duration_sec, sample_rate):
+        return duration_sec == self.duration_sec and sample_rate == self.sample_rate
+
+    def get_samples(self, midi_note_number):
+        return self.asset_pack.get_tone(midi_note_number, self.duration_sec)
+
+class AssetPackBackend:
+    """
+    TTS backend that speaks from an asset pack, so a session whose phrases are all packed never starts a
+    TTS engine. Phrases missing from the pack go to the fallback backend, which is only started when needed.
+    """
+
+    name = "assets"
+
+    def __init__(self, asset_pack, fallback_backend_name, prerender_workers=TTS_PRERENDER_WORKERS):
+        self.asset_pack = asset_pack
+        self.voice_id = asset_pack.voice_id
+        self.speech_rate = asset_pack.speech_rate
+        self._fallback_backend_name = fallback_backend_name
+        self._prerender_workers = prerender_workers
+        self._fallback_backend = None
+
+    def _fallback(self):
+        if self._fallback_backend is None:
+            print(f"Starting the {self._fallback_backend_name} TTS backend for phrases missing from {self.asset_pack.pack_path}")
+            self._fallback_backend = initialize_tts_backend(self._fallback_backend_name, self._prerender_workers)
+        return self._fallback_backend
+
+    def synthesize(self, texts, sample_rate=SAMPLE_RATE):
+        speech_arrays = {}
+        for text in texts:
+            speech = self.asset_pack.get_phrase(text)
+            if speech is not None:
+                speech_arrays[text] = resample_int16(speech, self.asset_pack.sample_rate, sample_rate)
+        missing_texts = [text for text in texts if text not in speech_arrays]
+        if missing_texts:
+            speech_arrays.update(self._fallback().synthesize(missing_texts, sample_rate))
+        return speech_arrays
+
+    def speak(self, text):
+        self._fallback().speak(text) # Only reached for phrases that were not pre-rendered
+
+    def close(self):
+        if self._fallback_backend is not None:
+            self._fallback_backend.close()
+
+# --- Session Configuration ---
+@dataclasses.dataclass
+class SessionConfig:
+    """Everything a practice session needs; main() builds one from the command line."""
+    elements: list # Unique scale degree strings exactly as input (e.g., ["1", "b3", "flat 7"])
+    root_notes: list # Root note names in original case, in cycling order
+    plays_per_root: int = 1
+    delay: float = 3.0
+    octave: int = 4
+    tone_name_delay: float = 1.0
+    audio_backend: str = "pygame" # One of AUDIO_BACKENDS; every backend except pygame renders offline
+    render_to: str = None # WAV path for the wav backend
+    render_duration: float = 300.0 # Seconds of audio to render with an offline backend
+    pcm_stream: object = None # Binary stream for the pcm backend; overrides pcm_out
+    pcm_out: str = None # File path for the pcm backend; None or "-" means stdout
+    shared_tones: str = None # Directory of memory-mapped tone tables shared by session processes; None renders per process
+    assets: str = None # Asset pack (see build_asset_pack()) to take speech and tones from; overrides shared_tones
+    cache_dir: str = None # Directory for the persistent speech cache; None disables it
+    tts_backend: str = "pyttsx3" # One of TTS_BACKENDS
+    tts_workers: int = TTS_PRERENDER_WORKERS # Processes for pre-rendering pyttsx3 phrases
+    seed: int = None # Seed for element selection; None picks (and prints) a random one
+    plan: object = None # SessionPlan to replay instead of selecting elements; the session ends with the plan
+    simulate: bool = False # Run on a virtual clock without TTS or audio, for render_duration seconds of session time
+
+class SessionControl:
+    """
+    Pause/resume handle for a run_session() task. Cancel the task itself to stop the session.
+    Pausing also pauses any audio already playing, instead of waiting for it to finish.
+    """
+
+    def __init__(self):
+        self._resumed = asyncio.Event()
+        self._resumed.set()
+        self.output = None # Set by run_session once the output is open
+
+    @property
+    def paused(self):
+        return not self._resumed.is_set()
+
+    def pause(self):
+        if self.paused:
+            return
+        self._resumed.clear()
+        if self.output is not None:
+            self.output.pause()
+
+    def resume(self):
+        if not self.paused:
+            return
+        if self.output is not None:
+            self.output.resume()
+        self._resumed.set()
+
+    async def wait_while_paused(self):
+        await self._resumed.wait()
+
+# --- Session Outputs ---
+# The practice loop awaits an "output" with speak(text, stage), play_tone(frequency, duration_sec, midi_note_number)
+# and wait(seconds); it also has an elapsed_sec property, a metrics attribute (the session's StageMetrics),
+# pause()/resume(), close() (finish pending audio) and cancel() (drop it). Live playback hands timed events
+# to a playback worker thread; offline rendering writes the same events to a WAV file against a virtual clock.
+# Outputs record speech (under the given stage name), playback and sleep times in their metrics where the
+# work actually happens.
+# Every delay in a session is an output.wait() against the output's clock (elapsed_sec), never a direct sleep:
+# live playback runs on a RealClock, rendering counts frames, and simulation runs on a VirtualClock.
+class RealClock:
+    """Wall-clock time: now() is time.monotonic(), and sleep() and sleep_blocking() really wait."""
+
+    def now(self):
+        return time.monotonic()
+
+    async def sleep(self, seconds):
+        await asyncio.sleep(seconds)
+
+    def sleep_blocking(self, seconds):
+        time.sleep(seconds)
+
+class VirtualClock:
+    """Simulated time that only moves when advanced: sleep() returns at once, so hours pass in moments."""
+
+    def __init__(self, start_sec=0.0):
+        self._now = start_sec
+
+    def now(self):
+        return self._now
+
+    def advance(self, seconds):
+        self._now += max(0.0, seconds)
+
+    async def sleep(self, seconds):
+        self.advance(seconds)
+        await asyncio.sleep(0) # Still yield, so other tasks (e.g., a SessionControl) get to run
+
+    def sleep_blocking(self, seconds):
+        self.advance(seconds)
+
+class PlaybackWorker(threading.Thread):
+    """
+    Consumes timed playback events from a queue and starts each one at its deadline.
+    During a session this thread is the only code that touches pygame; speech that was not pre-rendered is
+    synthesized with the TTS backend's synthesize() and played through the mixer too.
+    Event times are offsets (s) on a RealClock from start_time, which moves forward by the length of every pause.
+    """
+
+    def __init__(self, tts_backend, tone_bank=None, phrase_bank=None, metrics=None):
+        super().__init__(name="playback", daemon=True)
+        self.clock = RealClock() # Always real: the worker blocks on _wake for the time until each deadline
+        self.metrics = metrics if metrics is not None else StageMetrics()
+        self.tts_backend = tts_backend
+        self.tone_bank = tone_bank
+        self.phrase_bank = phrase_bank
+        self.events = queue.Queue()
+        self.stop_event = threading.Event()
+        self.start_time = self.clock.now()
+        self.paused = False
+        self.late_event_count = 0
+        self.max_lateness_sec = 0.0
+        self._wake = threading.Event() # Set on pause/resume/stop to interrupt waits
+        self._paused_at = None
+
+    def pause(self):
+        if self._paused_at is not None:
+            return # Already paused
+        self._paused_at = self.clock.now()
+        self.paused = True
+        self._wake.set()
+
+    def resume(self):
+        if self._paused_at is None:
+            return # Never paused
+        # Shift the timeline here rather than in the worker, so callers see the new start_time immediately
+        self.start_time += self.clock.now() - self._paused_at
+        self._paused_at = None
+        self.paused = False
+        self._wake.set()
+
+    def stop(self):
+        self.stop_event.set()
+        self._wake.set()
+
+    def _hold_while_paused(self):
+        if not self.paused:
+            return
+        pygame.mixer.pause()
+        while self.paused and not self.stop_event.is_set():
+            self._wake.wait()
+            self._wake.clear()
+        pygame.mixer.unpause()
+
+    def run(self):
+        while not self.stop_event.is_set():
+            try:
+                event = self.events.get(timeout=0.1)
+            except queue.Empty:
+                self._hold_while_paused() # Pause sounds that are still playing
+                continue
+            if event is None: # Sentinel: no more events
+                break
+            event_kind, due_offset_sec, payload = event
+            while True:
+                self._hold_while_paused()
+                remaining = self.start_time + due_offset_sec - self.clock.now()
+                if remaining <= 0 or self.stop_event.is_set():
+                    break
+                self._wake.wait(remaining)
+                self._wake.clear()
+            if self.stop_event.is_set():
+                break
+            if -remaining > PLAYBACK_LATE_THRESHOLD_SEC:
+                self.late_event_count += 1
+                self.max_lateness_sec = max(self.max_lateness_sec, -remaining)
+                self.metrics.mark("late_event", kind=event_kind, lateness_ms=-remaining * 1000)
+            try:
+                if event_kind == "speak":
+                    text, stage = payload
+                    with self.metrics.measure(stage, text=text):
+                        self._speak(text)
+                elif event_kind == "tone":
+                    with self.metrics.measure("playback", frequency=payload[0]):
+                        play_generated_tone(*payload, metrics=self.metrics)
+            except Exception as e:
+                print(f"Error during playback: {e}")
+        if self.stop_event.is_set():
+            pygame.mixer.stop() # Cancelled: silence anything still playing
+
+    def _speak(self, text):
+        if self.phrase_bank is not None and text not in self.phrase_bank:
+            # Not pre-rendered: synthesize it now and play it through the mixer like every other phrase,
+            # so no TTS engine is driven from this thread
+            self.phrase_bank.prerender([text])
+        sound = self.phrase_bank.get_sound(text) if self.phrase_bank is not None else None
+        if sound is None:
+            print(f"Skipping speech with no audio: {text}")
+            return
+        print(f"Speaking: {text}")
+        sound.play()
+        self.metrics.mark_audio(text, sound.get_length())
+
+class LiveSessionOutput:
+    """
+    Plays the session in real time through a PlaybackWorker.
+    The session loop only lays out a timeline: each call queues a timed event and advances elapsed_sec
+    by the event's known length, so selection and lookups for the next cycle run while the current one
+    plays. Waits only suspend the loop (asyncio.sleep) once it is more than PLAYBACK_LOOKAHEAD_SEC
+    ahead of playback.
+    """
+
+    def __init__(self, tts_backend, tone_bank=None, phrase_bank=None, metrics=None):
+        self.metrics = metrics if metrics is not None else StageMetrics()
+        self.phrase_bank = phrase_bank
+        self.worker = PlaybackWorker(tts_backend, tone_bank, phrase_bank, self.metrics)
+        self._timeline_sec = 0.0 # Offset of the next event from the worker's start
+        self.worker.start()
+
+    @property
+    def elapsed_sec(self):
+        # The timeline never runs behind real time: if the loop fell behind, later events start from now
+        return max(self._timeline_sec, self.worker.clock.now() - self.worker.start_time)
+
+    def _enqueue(self, event_kind, payload):
+        self._timeline_sec = self.elapsed_sec
+        self.worker.events.put((event_kind, self._timeline_sec, payload))
+
+    async def _throttle(self):
+        ahead_sec = self._timeline_sec - (self.worker.clock.now() - self.worker.start_time)
+        if ahead_sec > PLAYBACK_LOOKAHEAD_SEC:
+            with self.metrics.measure("sleep"):
+                await self.worker.clock.sleep(ahead_sec - PLAYBACK_LOOKAHEAD_SEC)
+
+    async def speak(self, text, stage="speech"):
+        if not text or text.isspace():
+            print("Skipping empty text for speech.")
+            return
+        self._enqueue("speak", (text, stage))
+        speech = self.phrase_bank.get_array(text) if self.phrase_bank is not None and text in self.phrase_bank else None
+        # Phrases outside the bank are synthesized by the worker when due; their length is unknown here
+        if speech is not None:
+            self._timeline_sec += len(speech) / self.phrase_bank.sample_rate
+        await self._throttle()
+
+    async def play_tone(self, frequency, duration_sec, midi_note_number=None):
+        if frequency is None:
+            print("Skipping tone generation (invalid frequency).")
+            return
+        self._enqueue("tone", (frequency, duration_sec, self.worker.tone_bank, midi_note_number))
+        self._timeline_sec += duration_sec
+        await self._throttle()
+
+    async def wait(self, seconds):
+        self._timeline_sec = self.elapsed_sec + seconds
+        await self._throttle()
+
+    def pause(self):
+        self.worker.pause()
+
+    def resume(self):
+        self.worker.resume()
+
+    def close(self):
+        """Lets queued events finish playing, then stops the worker and pygame."""
+        if not self.worker.stop_event.is_set():
+            self.worker.events.put(None)
+            self.worker.join()
+            # Let the last sound play out before shutting the mixer down
+            remaining = self.worker.start_time + self._timeline_sec - self.worker.clock.now()
+            if remaining > 0:
+                self.worker.clock.sleep_blocking(remaining)
+        if self.worker.late_event_count:
+            print(f"Playback: {self.worker.late_event_count} event(s) started late, "
+                  f"max {self.worker.max_lateness_sec * 1000:.0f} ms.")
+        self.worker.tts_backend.close()
+        pygame.quit()
+
+    def cancel(self):
+        """Drops all queued events and stops the worker immediately."""
+        self.worker.stop()
+        self.worker.join()
+
+# Sample sinks for rendered sessions: write(samples) takes mono int16 arrays, close() finishes the stream
+class WavFileSink:
+    """Writes samples to a mono 16-bit WAV file; the header is finalized on close()."""
+
+    def __init__(self, wav_path, sample_rate=SAMPLE_RATE):
+        self.description = wav_path
+        self._wav_file = wave.open(wav_path, "wb")
+        self._wav_file.setnchannels(1)
+        self._wav_file.setsampwidth(2)
+        self._wav_file.setframerate(sample_rate)
+
+    def write(self, samples):
+        self._wav_file.writeframesraw(samples.astype("<i2", copy=False)) # No copy on little-endian hosts
+
+    def close(self):
+        self._wav_file.close()
+
+class RawPcmSink:
+    """
+    Writes headerless s16le mono samples to a binary stream (e.g., stdout for piping into aplay or ffmpeg)
+    in fixed-size chunks of chunk_frames frames; only the final chunk, written on close(), may be shorter.
+    Samples are gathered in one preallocated chunk buffer, so memory use does not depend on session length.
+    """
+
+    def __init__(self, stream, description="stdout", chunk_frames=PCM_CHUNK_FRAMES, close_stream=False):
+        self.description = description
+        self._stream = stream
+        self._close_stream = close_stream
+        self._chunk = numpy.empty(chunk_frames, dtype="<i2")
+        self._chunk_fill = 0 # Frames of _chunk in use
+
+    def write(self, samples):
+        samples = samples.astype("<i2", copy=False) # No copy on little-endian hosts
+        chunk_frames = len(self._chunk)
+        position = 0
+        while position < len(samples):
+            if self._chunk_fill == 0 and len(samples) - position >= chunk_frames:
+                # Whole chunks go straight from the caller's array, without staging
+                self._stream.write(samples[position:position + chunk_frames])
+                position += chunk_frames
+                continue
+            num_frames = min(chunk_frames - self._chunk_fill, len(samples) - position)
+            self._chunk[self._chunk_fill:self._chunk_fill + num_frames] = samples[position:position + num_frames]
+            self._chunk_fill += num_frames
+            position += num_frames
+            if self._chunk_fill == chunk_frames:
+                self._stream.write(self._chunk)
+                self._chunk_fill = 0
+
+    def close(self):
+        if self._chunk_fill:
+            self._stream.write(self._chunk[:self._chunk_fill])
+            self._chunk_fill = 0
+        self._stream.flush()
+        if self._close_stream:
+            self._stream.close()
+
+class NullSink:
+    """Discards samples; the render output still tracks timing, so the whole hot path runs without a sound device."""
+
+    description = "null sink"
+
+    def write(self, samples):
+        pass
+
+    def close(self):
+        pass
+
+class RenderSessionOutput:
+    """
+    Renders the session into a sample sink as fast as possible.
+    Time is virtual: it is the number of frames written so far. Speech comes from the phrase bank and
+    each distinct tone is rendered once and memoized (at most 128 MIDI notes per duration, ~44 KB each at
+    0.5s), so long renders only copy samples. With a matching SharedToneTable, tones are written from its
+    mapping instead.
+    """
+
+    def __init__(self, sink, phrase_bank, sample_rate=SAMPLE_RATE, shared_tones=None, metrics=None):
+        self.metrics = metrics if metrics is not None else StageMetrics()
+        self.sink = sink
+        self.phrase_bank = phrase_bank
+        self.sample_rate = sample_rate
+        self.shared_tones = shared_tones
+        self.frames_written = 0
+        self._tone_renderer = ToneRenderer(sample_rate=sample_rate)
+        self._tone_arrays = {} # (midi_note, duration) or (frequency, duration) -> int16 array
+        self._silence = numpy.zeros(sample_rate, dtype=numpy.int16) # One second, reused for gaps
+        self._wall_start_time = time.monotonic()
+
+    @property
+    def elapsed_sec(self):
+        return self.frames_written / self.sample_rate
+
+    def _write(self, samples):
+        self.sink.write(samples)
+        self.frames_written += len(samples)
+
+    async def speak(self, text, stage="speech"):
+        if not text or text.isspace():
+            print("Skipping empty text for speech.")
+            return
+        print(f"Rendering speech: {text}")
+        with self.metrics.measure(stage, text=text):
+            self._write(self.phrase_bank.get_array(text))
+
+    async def play_tone(self, frequency, duration_sec, midi_note_number=None):
+        if frequency is None:
+            print("Skipping tone generation (invalid frequency).")
+            return
+        print(f"Rendering tone: {frequency:.2f} Hz for {duration_sec}s")
+        if (self.shared_tones is not None and midi_note_number is not None and 0 <= midi_note_number <= 127
+                and self.shared_tones.matches(duration_sec, self.sample_rate)):
+            tone = self.shared_tones.get_samples(midi_note_number)
+        else:
+            cache_key = (midi_note_number if midi_note_number is not None else frequency, duration_sec)
+            tone = self._tone_arrays.get(cache_key)
+            if tone is None:
+                # The renderer's buffer is reused by its next render, so the memoized tone is a copy
+                with self.metrics.measure("tone_synthesis"):
+                    tone = self._tone_renderer.render(frequency, duration_sec).copy()
+                self._tone_arrays[cache_key] = tone
+        with self.metrics.measure("playback", frequency=frequency):
+            self._write(tone)
+
+    async def wait(self, seconds):
+        remaining_frames = int(round(seconds * self.sample_rate))
+        with self.metrics.measure("sleep"):
+            while remaining_frames > 0:
+                chunk_frames = min(remaining_frames, len(self._silence))
+                self._write(self._silence[:chunk_frames])
+                remaining_frames -= chunk_frames
+        # Nothing else here awaits: yield once per wait (every cycle has one), so an embedding application's
+        # other tasks keep running and cancel() or a SessionControl pause takes effect during a render
+        await asyncio.sleep(0)
+
+    def pause(self):
+        pass # Rendering does not run in real time, so there is nothing to pause
+
+    def resume(self):
+        pass
+
+    def close(self):
+        try:
+            self.sink.close()
+        finally:
+            self.phrase_bank.tts_backend.close()
+        print(f"Rendered {self.elapsed_sec:.1f}s of audio to {self.sink.description} "
+              f"in {time.monotonic() - self._wall_start_time:.1f}s.")
+
+    def cancel(self):
+        pass # Nothing is pending: every event is written as soon as it is produced
+
+def format_session_time(seconds):
+    """Formats a session offset as H:MM:SS.mmm."""
+    minutes, seconds = divmod(seconds, 60.0)
+    return f"{int(minutes // 60)}:{int(minutes % 60):02d}:{seconds:06.3f}"
+
+class SimulatedSessionOutput:
+    """
+    Runs the session on a VirtualClock without TTS or audio: speaking and playing only advance the clock by
+    the event's length and record it, and waits return at once, so hours of session take moments.
+    Speech lengths come from speech_duration_sec(text), by default the fake TTS backend's estimate.
+    print_report() prints the recorded timeline and checks pacing, root cycling and fairness.
+    """
+
+    def __init__(self, speech_duration_sec=None, clock=None, metrics=None):
+        self.metrics = metrics if metrics is not None else StageMetrics() # Only the session loop's stages, in wall time
+        self.speech_duration_sec = speech_duration_sec or FakeTtsBackend().speech_duration_sec
+        self.clock = clock if clock is not None else VirtualClock()
+        self.events = [] # (start_sec, kind, duration_sec, detail)
+        self._wall_start_time = time.monotonic()
+
+    @property
+    def elapsed_sec(self):
+        return self.clock.now()
+
+    def _record(self, kind, duration_sec, detail):
+        self.events.append((self.clock.now(), kind, duration_sec, detail))
+        self.clock.advance(duration_sec)
+
+    async def speak(self, text, stage="speech"):
+        if not text or text.isspace():
+            return
+        self._record(stage, self.speech_duration_sec(text), text)
+
+    async def play_tone(self, frequency, duration_sec, midi_note_number=None):
+        if frequency is None:
+            return
+        self._record("tone", duration_sec, f"{frequency:.2f} Hz (MIDI {midi_note_number})")
+
+    async def wait(self, seconds):
+        await self.clock.sleep(seconds)
+
+    def pause(self):
+        pass # Virtual time only moves when the session advances it
+
+    def resume(self):
+        pass
+
+    def close(self):
+        pass
+
+    def cancel(self):
+        pass
+
+    def print_report(self, config, show_timeline=True):
+        """Prints the event timeline, then pacing, root cycling and fairness statistics for the session."""
+        if show_timeline:
+            print("Simulated timeline:")
+            for start_sec, kind, duration_sec, detail in self.events:
+                print(f"  {format_session_time(start_sec)}  {kind:<19} {duration_sec:6.3f}s  {detail}")
+
+        # Split the session into root passes: an announcement and the cycles that follow it
+        root_passes = [] # (root announcement, [cycle start times], Counter of spoken degrees)
+        for start_sec, kind, _, detail in self.events:
+            if kind == "announcement_speech":
+                root_passes.append((detail, [], collections.Counter()))
+            elif kind == "degree_speech" and root_passes:
+                root_passes[-1][1].append(start_sec)
+                root_passes[-1][2][detail] += 1
+
+        print(f"\nSimulated {format_session_time(self.elapsed_sec)} of session ({len(self.events)} events) "
+              f"in {time.monotonic() - self._wall_start_time:.2f}s.")
+        # Pacing: cycle starts within a root pass should be exactly --delay apart unless a cycle overran
+        intervals = [later - earlier for _, cycle_starts, _ in root_passes
+                     for earlier, later in zip(cycle_starts, cycle_starts[1:])]
+        if intervals:
+            late_intervals = [interval for interval in intervals if interval > config.delay + 1e-6]
+            print(f"Pacing: {len(intervals)} cycle interval(s), mean {sum(intervals) / len(intervals):.3f}s, "
+                  f"min {min(intervals):.3f}s, max {max(intervals):.3f}s (target {config.delay:.3f}s); "
+                  f"{len(late_intervals)} longer than the target (overruns).")
+
+        # Root cycling: announcements should follow the root notes in order, wrapping around
+        expected_announcements = [get_root_announcement_text(root_note) for root_note in config.root_notes]
+        out_of_order = [pass_index for pass_index, (announcement, _, _) in enumerate(root_passes)
+                        if announcement != expected_announcements[pass_index % len(expected_announcements)]]
+        activation_counts = collections.Counter(announcement for announcement, _, _ in root_passes)
+        print(f"Root cycling: {len(root_passes)} activation(s) ("
+              + ", ".join(f"{root_note} x{activation_counts[announcement]}"
+                          for root_note, announcement in zip(config.root_notes, expected_announcements))
+              + ("), in order." if not out_of_order else f"), OUT OF ORDER at activation(s) {out_of_order}."))
+
+        # Fairness: every completed pass should speak each degree exactly plays_per_root times
+        expected_counts = collections.Counter()
+        for element in config.elements:
+            speakable_degree = get_speakable_degree_name(element)
+            if speakable_degree and not speakable_degree.isspace():
+                expected_counts[speakable_degree] += config.plays_per_root
+        # The last pass may have been cut off by the session's end; it only counts once it is complete
+        completed_passes = root_passes[:-1] + [root_pass for root_pass in root_passes[-1:] if root_pass[2] == expected_counts]
+        unbalanced = [pass_index for pass_index, (_, _, degree_counts) in enumerate(completed_passes)
+                      if degree_counts != expected_counts]
+        total_counts = collections.Counter()
+        for _, _, degree_counts in root_passes:
+            total_counts.update(degree_counts)
+        print(f"Fairness: {len(completed_passes)} completed root pass(es), "
+              + ("each degree played exactly its share in every one." if not unbalanced
+                 else f"UNBALANCED pass(es) {unbalanced}."))
+        if total_counts:
+            print("Degree plays over the session: "
+                  + ", ".join(f"'{degree}' {count}" for degree, count in sorted(total_counts.items())))
+
+def open_audio_sink(config):
+    """Creates the sample sink for a rendered (non-pygame) audio backend."""
+    if config.audio_backend == "wav":
+        return WavFileSink(config.render_to)
+    if config.audio_backend == "pcm":
+        if config.pcm_stream is not None:
+            return RawPcmSink(config.pcm_stream, description=getattr(config.pcm_stream, "name", "stream"))
+        if config.pcm_out and config.pcm_out != "-":
+            return RawPcmSink(open(config.pcm_out, "wb"), description=config.pcm_out, close_stream=True)
+        return RawPcmSink(sys.stdout.buffer)
+    if config.audio_backend == "null":
+        return NullSink()
+    raise ValueError(f"Unknown audio backend '{config.audio_backend}'. Valid options: {', '.join(AUDIO_BACKENDS)}")
+
+class SessionScheduler:
+    """
+    Keeps the session on a steady tempo using absolute deadlines on the output's clock
+    (the playback timeline when live, frames written when rendering).
+    Every cycle has an absolute start time and its stages wait until offsets from that start, so speech,
+    synthesis and print time are absorbed instead of accumulating. A cycle that runs past its slot is
+    recorded as an overrun and the next cycle starts immediately, without trying to catch up.
+    """
+
+    def __init__(self, output, control=None):
+        self.output = output
+        self.control = control
+        self.cycle_start_sec = output.elapsed_sec
+        self.overrun_count = 0
+        self.total_overrun_sec = 0.0
+        self.max_overrun_sec = 0.0
+
+    def offset_now(self):
+        """Returns the time elapsed since the current cycle started."""
+        return self.output.elapsed_sec - self.cycle_start_sec
+
+    async def wait_until(self, offset_sec):
+        """Waits until offset_sec after the cycle start. Returns how late we already were (0.0 if on time)."""
+        if self.control is not None:
+            await self.control.wait_while_paused()
+        remaining = offset_sec - self.offset_now()
+        if remaining > 0:
+            await self.output.wait(remaining)
+            return 0.0
+        return -remaining
+
+    async def end_cycle(self, period_sec, label="Cycle"):
+        """Waits out the rest of a period_sec slot, then starts the next cycle at the slot's end (or now, if it overran)."""
+        overrun_sec = await self.wait_until(period_sec)
+        if overrun_sec > 0:
+            self.overrun_count += 1
+            self.total_overrun_sec += overrun_sec
+            self.max_overrun_sec = max(self.max_overrun_sec, overrun_sec)
+            self.output.metrics.mark("overrun", label=label, overrun_ms=overrun_sec * 1000)
+            print(f"Warning: {label} overran its {period_sec:.2f}s slot by {overrun_sec:.2f}s.")
+            self.cycle_start_sec = self.output.elapsed_sec
+        else:
+            self.cycle_start_sec += period_sec
+
+    def print_summary(self):
+        print(f"Timing: {self.overrun_count} overrun(s), total {self.total_overrun_sec:.2f}s, "
+              f"max {self.max_overrun_sec:.2f}s.")
+
+class EligibleElementPool:
+    """
+    The elements still to be played for the current root note, with O(1) draws and completion checks.
+    A draw picks uniformly among the elements that have not reached plays_per_root yet (the same
+    distribution as random.choice over an eligible list); an element that reaches its count is
+    swap-removed from the eligible list.
+    """
+
+    def __init__(self, elements, plays_per_root, rng=random):
+        self.elements = list(elements)
+        self.plays_per_root = plays_per_root
+        self.rng = rng
+        self.reset()
+
+    def reset(self):
+        """Makes every element eligible again with a play count of zero."""
+        self._eligible = list(self.elements)
+        self._play_counts = dict.fromkeys(self.elements, 0)
+
+    @property
+    def is_complete(self):
+        """True once every element has been played plays_per_root times."""
+        return not self._eligible
+
+    def play_count(self, element):
+        return self._play_counts[element]
+
+    def draw(self):
+        """Picks an eligible element, counts the play, and retires the element if it is now complete."""
+        idx = self.rng.randrange(len(self._eligible))
+        element = self._eligible[idx]
+        self._play_counts[element] += 1
+        if self._play_counts[element] >= self.plays_per_root:
+            last_element = self._eligible.pop()
+            if idx < len(self._eligible): # Move the last element into the freed slot
+                self._eligible[idx] = last_element
+        return element
+
+# --- Session Plans ---
+# A session is a sequence of plan steps: a root activation (element_entry is None) followed by that root's
+# element draws, cycling through the root notes. plan_session() generates steps from a seed; a SessionPlan
+# stores a finite prefix of them as indices and replays it, so the player needs no selection at all.
+SessionPlanStep = collections.namedtuple(
+    "SessionPlanStep", "root_index element_index root_entry element_entry play_count"
+)
+SESSION_PLAN_FORMAT = "scale-degree-speaker-plan"
+SESSION_PLAN_VERSION = 1
+
+def new_session_seed():
+    """Returns a random seed for a session that was not given one, so it can be printed and replayed."""
+    return random.SystemRandom().randrange(2**32)
+
+def plan_session(elements, root_notes, plays_per_root=1, seed=None, octave=4):
+    """
+    Lazily yields the SessionPlanSteps of a session, forever: each root note is activated in turn and
+    every element is drawn plays_per_root times (uniformly among those not yet done) before the next one.
+    Pure apart from the seeded generator: the same arguments and seed always yield the same steps.
+    """
+    root_entries, element_entries = compile_session_table(root_notes, elements, octave)
+    element_pool = EligibleElementPool(range(len(elements)), plays_per_root, random.Random(seed))
+    root_index = 0
+    while True:
+        root_entry = root_entries[root_index]
+        yield SessionPlanStep(root_index, None, root_entry, None, 0)
+        element_pool.reset()
+        while not element_pool.is_complete:
+            element_index = element_pool.draw()
+            yield SessionPlanStep(root_index, element_index, root_entry, element_entries[root_index][element_index],
+                                  element_pool.play_count(element_index))
+        root_index = (root_index + 1) % len(root_entries)
+
+@dataclasses.dataclass
+class SessionPlan:
+    """
+    A finite, replayable session: the settings it was planned with plus, per root pass, the root index
+    and the element indices in play order. Saved as compact JSON (see save()/load()).
+    """
+    elements: list
+    root_notes: list
+    plays_per_root: int
+    octave: int
+    seed: int
+    passes: list # [root_index, [element_index, ...]] per root pass, in order
+
+    @classmethod
+    def record(cls, elements, root_notes, plays_per_root=1, seed=None, octave=4, num_passes=1):
+        """Plans num_passes root passes with plan_session(); a missing seed is drawn and kept in the plan."""
+        if seed is None:
+            seed = new_session_seed()
+        passes = []
+        for step in plan_session(elements, root_notes, plays_per_root, seed, octave):
+            if step.element_entry is None:
+                if len(passes) == num_passes:
+                    break
+                passes.append([step.root_index, []])
+            else:
+                passes[-1][1].append(step.element_index)
+        return cls(list(elements), list(root_notes), plays_per_root, octave, seed, passes)
+
+    def steps(self):
+        """Yields the plan's SessionPlanSteps, exactly as plan_session() produced them."""
+        root_entries, element_entries = compile_session_table(self.root_notes, self.elements, self.octave)
+        for root_index, element_indices in self.passes:
+            root_entry = root_entries[root_index]
+            yield SessionPlanStep(root_index, None, root_entry, None, 0)
+            play_counts = collections.Counter()
+            for element_index in element_indices:
+                play_counts[element_index] += 1
+                yield SessionPlanStep(root_index, element_index, root_entry, element_entries[root_index][element_index],
+                                      play_counts[element_index])
+
+    def save(self, plan_path):
+        plan_json = {"format": SESSION_PLAN_FORMAT, "version": SESSION_PLAN_VERSION, **dataclasses.asdict(self)}
+        with open(plan_path, "w") as plan_file:
+            json.dump(plan_json, plan_file, separators=(",", ":"))
+
+    @classmethod
+    def load(cls, plan_path):
+        """Reads a plan written by save(). Raises ValueError if the file is not a valid plan."""
+        with open(plan_path) as plan_file:
+            plan_json = json.load(plan_file)
+        if (not isinstance(plan_json, dict) or plan_json.get("format") != SESSION_PLAN_FORMAT
+                or plan_json.get("version") != SESSION_PLAN_VERSION):
+            raise ValueError("not a session plan file (or an unsupported version)")
+        try:
+            plan = cls(**{field.name: plan_json[field.name] for field in dataclasses.fields(cls)})
+        except KeyError as e:
+            raise ValueError(f"missing field {e}")
+        def is_int(value): # JSON booleans are ints to isinstance(), so they are ruled out explicitly
+            return isinstance(value, int) and not isinstance(value, bool)
+        for field_name in ("elements", "root_notes"):
+            field_value = getattr(plan, field_name)
+            if not isinstance(field_value, list) or not all(isinstance(item, str) for item in field_value):
+                raise ValueError(f"{field_name} must be a list of strings")
+        for field_name in ("plays_per_root", "octave", "seed"):
+            if not is_int(getattr(plan, field_name)):
+                raise ValueError(f"{field_name} must be an integer")
+        if plan.plays_per_root < 1:
+            raise ValueError("plays_per_root must be at least 1")
+        if not isinstance(plan.passes, list) or not all(
+                isinstance(root_pass, list) and len(root_pass) == 2 and is_int(root_pass[0])
+                and isinstance(root_pass[1], list) and all(is_int(element_index) for element_index in root_pass[1])
+                for root_pass in plan.passes):
+            raise ValueError("passes must be a list of [root_index, [element_index, ...]] pairs")
+        for root_note_name in plan.root_notes:
+            if root_note_name.upper() not in ROOT_NOTES_SEMITONES_FROM_C:
+                raise ValueError(f"invalid root note '{root_note_name}'")
+        for root_index, element_indices in plan.passes:
+            if not 0 <= root_index < len(plan.root_notes) or any(
+                    not 0 <= element_index < len(plan.elements) for element_index in element_indices):
+                raise ValueError("root or element index out of range")
+        return plan
+
+async def activate_root_note(root_entry, octave, output, scheduler):
+    """Announces a new root note (a SessionRootEntry)."""
+    # The whole switch, announcement gap included, is recorded as one root_switch stage
+    with output.metrics.measure("root_switch", root=root_entry.name):
+        await output.speak(root_entry.announcement_text, stage="announcement_speech")
+        # The announcement slot ends a fixed gap after the speech; the next cycle is anchored there
+        await scheduler.end_cycle(scheduler.offset_now() + NEW_ROOT_NOTE_ANNOUNCEMENT_DELAY_SEC, "Root announcement")
+
+        print(f"Activated Root Note: {root_entry.name} (Octave {octave}). Root MIDI: {root_entry.midi_note}")
+
+def print_session_plan(config):
+    """Prints what a session would say and play, per root note, without loading any audio or TTS library."""
+    root_entries, element_entries = compile_session_table(config.root_notes, config.elements, config.octave)
+    cycles_per_root = len(config.elements) * config.plays_per_root
+    for root_entry, entries_for_root in zip(root_entries, element_entries):
+        print(f"\nRoot {root_entry.name} (MIDI {root_entry.midi_note}), announced as '{root_entry.announcement_text}':")
+        for entry in entries_for_root:
+            if entry.frequency is None:
+                print(f"  '{entry.element}' spoken as '{entry.speakable_degree}': not recognized, no tone")
+            else:
+                print(f"  '{entry.element}' spoken as '{entry.speakable_degree}': MIDI {entry.midi_note} "
+                      f"({entry.frequency:.2f} Hz), note name '{entry.note_name.strip()}'")
+    # Announcement speech length is unknown without TTS, so only its fixed gap is counted
+    pass_sec = len(root_entries) * (NEW_ROOT_NOTE_ANNOUNCEMENT_DELAY_SEC + cycles_per_root * config.delay)
+    print(f"\n{cycles_per_root} cycle(s) per root note; one pass through all root notes takes at least {pass_sec:.1f}s.")
+    if config.audio_backend == "pygame":
+        print(f"Would play live with the {config.tts_backend} TTS backend.")
+    else:
+        destination = config.render_to if config.audio_backend == "wav" else config.audio_backend
+        print(f"Would render {config.render_duration}s to {destination} with the {config.tts_backend} TTS backend.")
+
+def open_session_output(config, sink=None, metrics=None):
+    """
+    Initializes TTS (and pygame for live playback), pre-renders the session's phrases and tones,
+    and returns the output the practice loop should drive. Raises RuntimeError if audio setup fails.
+    An offline backend renders into sink if one is given, instead of opening the config's output.
+    A simulated session gets a SimulatedSessionOutput and loads no audio or TTS library.
+    The output records stage latencies in metrics (a new StageMetrics if None), from setup onward.
+    """
+    metrics = metrics if metrics is not None else StageMetrics()
+    if config.simulate:
+        # Speech lengths are estimated, or read from an asset pack's index when one is given
+        if not config.assets:
+            return SimulatedSessionOutput(metrics=metrics)
+        try:
+            asset_pack = AssetPack(config.assets)
+        except (OSError, ValueError) as e:
+            raise RuntimeError(f"Error opening asset pack {config.assets}: {e}")
+        estimate_duration_sec = FakeTtsBackend().speech_duration_sec
+        def speech_duration_sec(text):
+            duration_sec = asset_pack.phrase_duration_sec(text)
+            return duration_sec if duration_sec is not None else estimate_duration_sec(text)
+        return SimulatedSessionOutput(speech_duration_sec, metrics=metrics)
+
+    asset_pack = None
+    if config.assets:
+        try:
+            asset_pack = AssetPack(config.assets)
+        except (OSError, ValueError) as e:
+            raise RuntimeError(f"Error opening asset pack {config.assets}: {e}")
+        print(f"Asset pack mapped: {config.assets} ({asset_pack.voice_id}, {asset_pack.sample_rate} Hz)")
+        # Packed phrases need no TTS engine; the configured backend only starts if a phrase is missing
+        tts_backend = AssetPackBackend(asset_pack, config.tts_backend, config.tts_workers)
+    else:
+        tts_backend = initialize_tts_backend(config.tts_backend, config.tts_workers)
+    # Offline renders are mono int16 at SAMPLE_RATE; live output follows whatever the mixer negotiated
+    output_rate, output_format, output_channels = SAMPLE_RATE, DEFAULT_MIXER_FORMAT, 1
+    if config.audio_backend == "pygame":
+        try:
+            # Initialize Pygame mixer, try for mono but adapt if stereo
+            pygame.mixer.pre_init(SAMPLE_RATE, DEFAULT_MIXER_FORMAT, 1, 512) 
+            pygame.init() # Initializes all pygame modules
+            mixer_status = pygame.mixer.get_init() # Check actual mixer settings
+        except Exception as e:
+            raise RuntimeError(f"Error initializing Pygame: {e}")
+        if not mixer_status:
+            raise RuntimeError("CRITICAL ERROR: Pygame mixer failed to initialize.")
+        print(f"Pygame mixer initialized with: Frequency={mixer_status[0]}, Format={mixer_status[1]}, Channels={mixer_status[2]}")
+        output_rate, output_format, output_channels = mixer_status
+        if output_format not in MIXER_SAMPLE_FORMATS:
+            if abs(output_format) == 32:
+                raise RuntimeError("Unsupported mixer sample format: 32-bit (pygame reports integer and float 32-bit "
+                                   "output alike, so samples cannot be converted safely); use an 8- or 16-bit audio device.")
+            raise RuntimeError(f"Unsupported mixer sample format: {output_format}")
+
+    shared_tones = None
+    if asset_pack is not None and asset_pack.sample_rate == output_rate:
+        shared_tones = asset_pack.tone_table(TONE_DURATION_SEC)
+    if shared_tones is None and config.shared_tones:
+        try:
+            shared_tones = SharedToneTable.open(config.shared_tones, TONE_DURATION_SEC, output_rate, metrics=metrics)
+        except (OSError, ValueError) as e:
+            raise RuntimeError(f"Error opening shared tone table in {config.shared_tones}: {e}")
+        print(f"Shared tone table mapped: {shared_tones.table_path}")
+
+    # Synthesize every phrase the session can speak up front, so speech never waits on the TTS engine
+    disk_cache = open_speech_disk_cache(config.cache_dir, tts_backend, output_rate) if config.cache_dir else None
+    phrase_bank = PhraseBank(tts_backend, num_channels=output_channels, sample_rate=output_rate,
+                             disk_cache=disk_cache, mixer_format=output_format, metrics=metrics)
+    phrase_bank.prerender(get_session_phrases(config.elements, config.root_notes))
+    print(f"Phrase bank ready: {len(phrase_bank)} phrase(s)")
+
+    if config.audio_backend != "pygame":
+        # Offline render: no audio device, time advances with the samples written
+        if sink is None:
+            try:
+                sink = open_audio_sink(config)
+            except Exception as e:
+                raise RuntimeError(f"Error opening {config.audio_backend} audio output: {e}")
+        print(f"Rendering {config.render_duration}s session to: {sink.description}")
+        return RenderSessionOutput(sink, phrase_bank, shared_tones=shared_tones, metrics=metrics)
+
+    # Pre-render every tone this session can play so the loop only replays cached sounds
+    tone_bank = ToneBank.for_mixer(TONE_DURATION_SEC, shared_tones=shared_tones, metrics=metrics)
+    tone_bank.prerender(get_session_midi_notes(config.root_notes, config.elements, config.octave))
+    print(f"Tone bank ready: {len(tone_bank)} tone(s), {tone_bank.total_bytes / 1024:.0f} KiB")
+    return LiveSessionOutput(tts_backend, tone_bank, phrase_bank, metrics)
+
+def _close_cancelled_output(setup):
+    if not setup.cancelled() and setup.exception() is None:
+        output = setup.result()
+        output.cancel()
+        output.close()
+
+async def run_session(config, control=None, output=None):
+    """
+    Runs a practice session as an asyncio coroutine, for the command line or an embedding application.
+    Speech, tones and delays are awaited rather than blocking, so other tasks keep running alongside.
+    Cancel the task to stop immediately (pending audio is dropped); use a SessionControl to pause and resume.
+    Per-stage latencies are collected in output.metrics (reset when the session starts; the trace is kept).
+    A live (pygame) session runs until cancelled; other backends and simulations end after config.render_duration seconds.
+    A session replaying config.plan also ends when the plan does.
+    If no output is given, one is opened from the config on a worker thread (pre-rendering blocks) and
+    closed when the session ends.
+    """
+    owns_output = output is None
+    if owns_output:
+        # Setup blocks on TTS pre-rendering (and pygame), so it runs on a worker thread, not the event loop
+        setup = asyncio.ensure_future(asyncio.to_thread(open_session_output, config))
+        try:
+            output = await asyncio.shield(setup)
+        except asyncio.CancelledError:
+            # The thread cannot be interrupted; shut its output down as soon as it has been opened
+            setup.add_done_callback(_close_cancelled_output)
+            raise
+    if control is not None:
+        control.output = output
+        if control.paused: # Paused during setup: the output starts paused too, so resume() has something to undo
+            output.pause()
+    max_duration_sec = config.render_duration if config.audio_backend != "pygame" or config.simulate else None
+    output.metrics.reset() # Stage metrics cover the session itself, not pre-rendering
+    scheduler = SessionScheduler(output, control)
+    try:
+        await _run_practice_loop(config, output, scheduler, control, max_duration_sec)
+    except asyncio.CancelledError:
+        output.cancel()
+        raise
+    finally:
+        scheduler.print_summary()
+        if control is not None:
+            control.output = None
+        if owns_output:
+            output.close()
+
+def simulate_session(config, show_timeline=True):
+    """
+    Fast-forwards a session on a virtual clock (see SimulatedSessionOutput) and prints its timeline and
+    statistics instead of the session's own progress messages. Raises RuntimeError if an asset pack cannot be read.
+    """
+    if config.seed is None and config.plan is None:
+        config = dataclasses.replace(config, seed=new_session_seed())
+    config = dataclasses.replace(config, simulate=True)
+    output = open_session_output(config)
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        asyncio.run(run_session(config, output=output))
+    if config.plan is None:
+        print(f"Session seed: {config.seed} (use --seed {config.seed} to repeat this session)")
+    output.print_report(config, show_timeline)
+
+class _PcmStreamClosed(Exception):
+    """Raised inside a render when the consumer of iter_session_pcm() has stopped reading."""
+
+class _ChunkQueueWriter:
+    """Binary stream for a RawPcmSink that hands each chunk to iter_session_pcm() through a bounded queue."""
+
+    def __init__(self, max_chunks):
+        self.chunks = queue.Queue(maxsize=max_chunks)
+        self.cancelled = threading.Event()
+
+    def _put(self, item):
+        # Blocks while the queue is full; returns False once the consumer has gone away
+        while not self.cancelled.is_set():
+            try:
+                self.chunks.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def write(self, data):
+        if not self._put(bytes(data)): # Copied: the sink reuses its chunk buffer
+            raise _PcmStreamClosed()
+
+    def flush(self):
+        pass
+
+    def end(self, error=None):
+        """Marks the end of the stream; error (an exception) is re-raised in the consumer."""
+        self._put(error)
+
+def iter_session_pcm(config, chunk_frames=PCM_CHUNK_FRAMES, max_queued_chunks=PCM_STREAM_MAX_QUEUED_CHUNKS):
+    """
+    Generator that renders a session offline (s16le mono at SAMPLE_RATE, config.audio_backend is ignored)
+    on a background thread and yields it as bytes chunks of chunk_frames frames; only the last may be shorter.
+    Rendering waits while max_queued_chunks chunks are unread, so memory stays bounded however long the
+    session is. Closing the generator early stops the render. Raises RuntimeError if setup fails.
+    """
+    render_config = dataclasses.replace(config, audio_backend="pcm")
+    writer = _ChunkQueueWriter(max_queued_chunks)
+    output = open_session_output(render_config, sink=RawPcmSink(writer, "generator", chunk_frames))
+
+    def render():
+        try:
+            try:
+                asyncio.run(run_session(render_config, output=output))
+            finally:
+                output.close() # Writes the final, partial chunk
+        except _PcmStreamClosed:
+            return
+        except BaseException as e:
+            writer.end(e)
+            return
+        writer.end()
+
+    render_thread = threading.Thread(target=render, name="pcm-render", daemon=True)
+    render_thread.start()
+    try:
+        while True:
+            item = writer.chunks.get()
+            if item is None:
+                return
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+    finally:
+        writer.cancelled.set()
+        while render_thread.is_alive(): # Unblock a render waiting on a full queue
+            try:
+                writer.chunks.get(timeout=0.1)
+            except queue.Empty:
+                pass
+        render_thread.join()
+
+async def _run_practice_loop(config, output, scheduler, control, max_duration_sec):
+    if config.plan is not None:
+        steps = config.plan.steps() # Replay: every draw was made when the plan was recorded
+    else:
+        seed = config.seed if config.seed is not None else new_session_seed()
+        print(f"Session seed: {seed} (use --seed {seed} to repeat this session)")
+        steps = plan_session(config.elements, config.root_notes, config.plays_per_root, seed, config.octave)
+    current_root = None
+
+    while max_duration_sec is None or output.elapsed_sec < max_duration_sec:
+        if control is not None:
+            await control.wait_while_paused()
+
+        # Next step of the plan: a root note activation, or an element that still needs to be played for this root
+        with output.metrics.measure("selection"):
+            step = next(steps, None)
+        if step is None:
+            print("\nEnd of session plan.")
+            break
+
+        # A root step starts the next root note once the current one's elements have all been played
+        if step.element_entry is None:
+            if current_root is not None:
+                print(f"\n--- Root Note '{current_root.name}' session complete. ---")
+            await activate_root_note(step.root_entry, config.octave, output, scheduler)
+            if current_root is None:
+                print(f"\nStarting practice. Press Ctrl+C to stop.")
+            else:
+                print(f"--- Continuing with new root note: {step.root_entry.name} ---")
+            current_root = step.root_entry
+            continue
+
+        entry = step.element_entry
+        print(f"\nNext element for root {current_root.name}: '{entry.element}' (spoken as '{entry.speakable_degree}')")
+        await output.speak(entry.speakable_degree, stage="degree_speech") # 1. Speak scale degree
+
+        # 2. Play tone (if the degree was recognized)
+        if entry.frequency is not None:
+            tone_start_offset = scheduler.offset_now()
+            await output.play_tone(entry.frequency, TONE_DURATION_SEC, entry.midi_note)
+
+            # 3. Note name is due tone_name_delay after the tone ends, then 4. speak it
+            await scheduler.wait_until(tone_start_offset + TONE_DURATION_SEC + config.tone_name_delay)
+            await output.speak(entry.note_name, stage="note_speech")
+
+        print(f"Element '{entry.element}' play count for root {current_root.name}: "
+              f"{step.play_count}/{config.plays_per_root}")
+
+        # 5. Wait for the end of this cycle's slot; config.delay is the time from the start of this cycle to the start of the next
+        await scheduler.end_cycle(config.delay)
+
+# --- Batch Rendering ---
+# A batch manifest is JSON: a list of jobs, or {"defaults": {...}, "jobs": [...]} where every job starts from
+# the defaults. A job sets any of BATCH_JOB_FIELDS; "per_root": true splits it into one track per root note.
+BATCH_JOB_FIELDS = ("elements", "root_notes", "octave", "plays_per_root", "delay", "tone_name_delay", "seed",
+                    "duration", "output", "per_root")
+BATCH_WORKERS = os.cpu_count() or 1 # Sessions rendered at once by the batch command
+
+def _parse_batch_list(value):
+    """Degrees and root notes in a manifest may be lists or comma-separated strings, as on the command line."""
+    items = value.split(",") if isinstance(value, str) else value or []
+    return [str(item).strip() for item in items if str(item).strip()]
+
+def _check_batch_output_name(output_name):
+    """Raises ValueError unless output_name is a relative path that stays inside the output directory."""
+    if not isinstance(output_name, str):
+        raise ValueError("output must be a string")
+    normalized = os.path.normpath(output_name)
+    if os.path.isabs(output_name) or os.path.splitdrive(output_name)[0] or normalized.split(os.sep)[0] == os.pardir:
+        raise ValueError(f"output '{output_name}' is outside the output directory")
+
+def load_batch_manifest(manifest_path, output_dir, render_duration=300.0):
+    """
+    Reads a batch manifest and returns one SessionConfig per track, rendering to a WAV file in output_dir.
+    Tracks without a seed get a fresh one, so every track in the batch can be reproduced.
+    Raises ValueError if the manifest is invalid, including outputs that escape output_dir or that
+    two tracks share.
+    """
+    with open(manifest_path) as manifest_file:
+        manifest = json.load(manifest_file)
+    defaults = {}
+    if isinstance(manifest, dict):
+        defaults, manifest = manifest.get("defaults", {}), manifest.get("jobs")
+    if not isinstance(manifest, list) or not isinstance(defaults, dict):
+        raise ValueError("expected a list of jobs or an object with a \"jobs\" list")
+
+    configs = []
+    render_paths = set() # Normalized, so "a.wav" and "./a.wav" count as the same track
+    for job_number, job in enumerate(manifest, start=1):
+        if not isinstance(job, dict):
+            raise ValueError(f"job {job_number} is not an object")
+        job = {**defaults, **job}
+        unknown_fields = sorted(set(job) - set(BATCH_JOB_FIELDS))
+        if unknown_fields:
+            raise ValueError(f"job {job_number}: unknown field(s) {', '.join(unknown_fields)}")
+        elements, root_notes = _parse_batch_list(job.get("elements")), _parse_batch_list(job.get("root_notes"))
+        if not elements or not root_notes:
+            raise ValueError(f"job {job_number}: elements and root_notes are required")
+        for root_note in root_notes:
+            if root_note.upper() not in ROOT_NOTES_SEMITONES_FROM_C:
+                raise ValueError(f"job {job_number}: invalid root note '{root_note}'")
+        root_note_groups = [[root_note] for root_note in root_notes] if job.get("per_root") else [root_notes]
+        if job.get("output") and len(root_note_groups) > 1:
+            raise ValueError(f"job {job_number}: output cannot be combined with per_root")
+        for job_root_notes in root_note_groups:
+            output_name = job.get("output") or f"{len(configs) + 1:03d}-{'-'.join(job_root_notes)}.wav"
+            try:
+                _check_batch_output_name(output_name)
+                render_to = os.path.join(output_dir, output_name)
+                render_key = os.path.normcase(os.path.normpath(render_to))
+                if render_key in render_paths:
+                    raise ValueError(f"output '{output_name}' is already used by an earlier track")
+                render_paths.add(render_key)
+                # A null field (e.g., "delay": null) makes float()/int() raise TypeError; report it like a bad value
+                configs.append(SessionConfig(
+                    elements=sorted(set(elements)),
+                    root_notes=job_root_notes,
+                    plays_per_root=max(1, int(job.get("plays_per_root", 1))),
+                    delay=max(0.0, float(job.get("delay", 3.0))),
+                    octave=int(job.get("octave", 4)),
+                    tone_name_delay=max(0.0, float(job.get("tone_name_delay", 1.0))),
+                    audio_backend="wav",
+                    render_to=render_to,
+                    render_duration=max(0.0, float(job.get("duration", render_duration))),
+                    seed=int(job["seed"]) if job.get("seed") is not None else new_session_seed(),
+                ))
+            except (TypeError, ValueError) as e:
+                raise ValueError(f"job {job_number}: {e}")
+    return configs
+
+def _render_batch_job(config):
+    """Runs in a batch worker process: renders one session quietly and returns the wall time (s) it took."""
+    started = time.perf_counter()
+    os.makedirs(os.path.dirname(os.path.abspath(config.render_to)), exist_ok=True) # Outputs may name subdirectories
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        asyncio.run(run_session(config))
+    return time.perf_counter() - started
+
+def render_batch(configs, assets, tts_backend_name="pyttsx3", num_workers=BATCH_WORKERS):
+    """
+    Renders every config across a pool of num_workers processes, printing progress as tracks finish.
+    Every worker maps the same asset pack, so speech is synthesized (by the parent, if assets does not
+    name an existing pack) and tones rendered once for the whole batch. Returns the number of failed tracks.
+    """
+    own_pack = not assets
+    if own_pack:
+        # One pack with every phrase of every track; workers then never start a TTS engine
+        phrases = list(dict.fromkeys(phrase for config in configs
+                                     for phrase in get_session_phrases(config.elements, config.root_notes)))
+        tts_backend = initialize_tts_backend(tts_backend_name)
+        fd, assets = tempfile.mkstemp(prefix="scale_degree_batch_", suffix=".pack")
+        os.close(fd)
+        try:
+            print(f"Pre-rendering {len(phrases)} phrase(s) and 128 tone(s) for {len(configs)} track(s)...")
+            build_asset_pack(assets, tts_backend, phrases)
+        except BaseException:
+            os.remove(assets)
+            raise
+        finally:
+            tts_backend.close()
+
+    num_failed = 0
+    batch_started = time.perf_counter()
+    try:
+        # spawn, not fork, as for TTS pre-rendering: workers start clean and map the pack themselves
+        with concurrent.futures.ProcessPoolExecutor(max(1, min(num_workers, len(configs))),
+                                                    mp_context=multiprocessing.get_context("spawn")) as executor:
+            futures = {}
+            for config in configs:
+                config = dataclasses.replace(config, assets=assets, tts_backend=tts_backend_name)
+                futures[executor.submit(_render_batch_job, config)] = config
+            for num_done, future in enumerate(concurrent.futures.as_completed(futures), start=1):
+                config = futures[future]
+                try:
+                    elapsed_sec = future.result()
+                except Exception as e:
+                    num_failed += 1
+                    print(f"[{num_done}/{len(configs)}] FAILED {config.render_to}: {e}")
+                    continue
+                print(f"[{num_done}/{len(configs)}] {config.render_to} ({config.render_duration:.0f}s of audio, "
+                      f"seed {config.seed}) in {elapsed_sec:.1f}s")
+    finally:
+        if own_pack:
+            os.remove(assets)
+    print(f"Batch finished in {time.perf_counter() - batch_started:.1f}s: "
+          f"{len(configs) - num_failed} track(s) rendered, {num_failed} failed.")
+    return num_failed
 
 # --- Main Program ---
+def build_assets_main(argv):
+    """The build-assets command: writes an asset pack for later sessions to map with --assets."""
+    parser = argparse.ArgumentParser(
+        prog=f"{os.path.basename(sys.argv[0])} build-assets",
+        description='Pre-renders speech and tones into one asset pack file for fast session startup (--assets).'
+    )
+    parser.add_argument('pack_path', type=str, help='Asset pack file to write (replaced atomically if it exists).')
+    parser.add_argument('--elements', type=str, default=None, help='Comma-separated scale degrees to pack speech for (default: every supported degree).')
+    parser.add_argument('--root_notes', type=str, default=None, help='Comma-separated root notes to pack announcements for (default: every root note).')
+    parser.add_argument('--tts_backend', '--tts-backend', choices=TTS_BACKENDS, default="pyttsx3", help='Text-to-speech engine that speaks the packed phrases (default: pyttsx3).')
+    parser.add_argument('--tts_workers', '--tts-workers', type=int, default=TTS_PRERENDER_WORKERS, help=f'Processes used to pre-render pyttsx3 phrases, 1 for serial (default: {TTS_PRERENDER_WORKERS}).')
+    args = parser.parse_args(argv)
+
+    elements = [elem.strip() for elem in args.elements.split(',') if elem.strip()] if args.elements else None
+    root_notes = [rn.strip() for rn in args.root_notes.split(',') if rn.strip()] if args.root_notes else None
+    for rn_str_orig in root_notes or []:
+        if rn_str_orig.upper() not in ROOT_NOTES_SEMITONES_FROM_C:
+            print(f"Error: Invalid root note '{rn_str_orig}' in list. Valid options include: {', '.join(ROOT_NOTES_SEMITONES_FROM_C.keys())}")
+            sys.exit(1)
+    phrases = get_asset_pack_phrases(elements, root_notes)
+    try:
+        tts_backend = initialize_tts_backend(args.tts_backend, max(1, args.tts_workers))
+    except RuntimeError as e:
+        print(e); sys.exit(1)
+    print(f"Packing {len(phrases)} phrase(s) and 128 tone(s) into: {args.pack_path}")
+    try:
+        pack_bytes = build_asset_pack(args.pack_path, tts_backend, phrases)
+    except OSError as e:
+        print(f"Error: Could not write asset pack {args.pack_path}: {e}"); sys.exit(1)
+    finally:
+        tts_backend.close()
+    print(f"Asset pack written: {args.pack_path} ({pack_bytes / (1024 * 1024):.1f} MiB)")
+
+def batch_main(argv):
+    """The batch command: renders every session in a manifest to its own WAV file, in parallel."""
+    parser = argparse.ArgumentParser(
+        prog=f"{os.path.basename(sys.argv[0])} batch",
+        description='Renders each session of a JSON manifest to its own WAV file across a pool of worker processes.'
+    )
+    parser.add_argument('manifest', type=str, help=f'JSON list of jobs, or {{"defaults": {{...}}, "jobs": [...]}}; job fields: {", ".join(BATCH_JOB_FIELDS)}.')
+    parser.add_argument('--output_dir', '--output-dir', type=str, default=".", help='Directory for the rendered WAV files (default: current directory).')
+    parser.add_argument('--workers', type=int, default=BATCH_WORKERS, help=f'Sessions rendered at once (default: CPU count, {BATCH_WORKERS}).')
+    parser.add_argument('--render_duration', '--render-duration', type=float, default=300.0, help='Length (s) of tracks whose job sets no duration (default: 300.0).')
+    parser.add_argument('--tts_backend', '--tts-backend', choices=TTS_BACKENDS, default="pyttsx3", help='Text-to-speech engine used to pre-render the batch\'s phrases (default: pyttsx3).')
+    parser.add_argument('--assets', type=str, default=None, metavar='PACK_PATH', help='Use this asset pack (see build-assets) instead of pre-rendering one for the batch.')
+    args = parser.parse_args(argv)
+
+    try:
+        os.makedirs(args.output_dir, exist_ok=True)
+        configs = load_batch_manifest(args.manifest, args.output_dir, args.render_duration)
+    except (OSError, TypeError, ValueError) as e:
+        print(f"Error: Could not load batch manifest {args.manifest}: {e}"); sys.exit(1)
+    if not configs:
+        print("Error: The batch manifest has no jobs."); sys.exit(1)
+    try:
+        num_failed = render_batch(configs, args.assets, args.tts_backend, args.workers)
+    except KeyboardInterrupt:
+        print("\nBatch stopped by user."); sys.exit(1)
+    except RuntimeError as e:
+        print(e); sys.exit(1)
+    if num_failed:
+        sys.exit(1)
+
 def main():
+    if sys.argv[1:2] == ["build-assets"]:
+        build_assets_main(sys.argv[2:])
+        return
+    if sys.argv[1:2] == ["batch"]:
+        batch_main(sys.argv[2:])
+        return
     parser = argparse.ArgumentParser(
         description='Speaks random scale degrees, plays tones, speaks note names (contextually), and cycles through root notes.'
     )
-    parser.add_argument('elements_string', type=str, help='Comma-separated scale degrees (e.g., "1,flat 3,5,b9,#11").')
-    parser.add_argument('--root_notes', type=str, required=True, help='Comma-separated musical root notes (e.g., "C,Db,F#").')
+    parser.add_argument('elements_string', type=str, nargs='?', default=None, help='Comma-separated scale degrees (e.g., "1,flat 3,5,b9,#11"); not used with --play_plan.')
+    parser.add_argument('--root_notes', type=str, default=None, help='Comma-separated musical root notes (e.g., "C,Db,F#"); required unless --play_plan is given.')
     parser.add_argument('--plays_per_root', type=int, default=1, help='Times each unique degree is played per root note before switching (min 1, default: 1).')
-    parser.add_argument('--delay', type=float, default=3.0, help='Approx. delay (s) between element cycles (default: 3.0).')
+    parser.add_argument('--delay', type=float, default=3.0, help='Time (s) from the start of one element cycle to the start of the next (default: 3.0).')
     parser.add_argument('--octave', type=int, default=4, help='Octave for root notes (e.g., 4 for C4, default: 4).')
     parser.add_argument('--tone_name_delay', type=float, default=1.0, help='Delay (s) after tone before speaking its name (default: 1.0).')
+    parser.add_argument('--audio_backend', '--audio-backend', choices=AUDIO_BACKENDS, default=None, help='Audio output: pygame plays live; wav (--render_to file), pcm (raw s16le to stdout) and null (discard) render offline (default: pygame, or wav with --render_to).')
+    parser.add_argument('--render_to', '--render-to', type=str, default=None, metavar='WAV_PATH', help='Render the session offline to this WAV file instead of playing it live.')
+    parser.add_argument('--pcm_out', '--pcm-out', type=str, default=None, metavar='PATH', help='Stream the session as raw s16le mono PCM to this file, or to stdout with "-" (selects the pcm audio backend).')
+    parser.add_argument('--render_duration', '--render-duration', type=float, default=300.0, help='Length (s) of an offline render (default: 300.0).')
+    parser.add_argument('--tts_backend', '--tts-backend', choices=TTS_BACKENDS, default="pyttsx3", help='Text-to-speech engine: pyttsx3, espeak-ng (pool of warm subprocesses) or fake (silence, for CI and benchmarks) (default: pyttsx3).')
+    parser.add_argument('--tts_workers', '--tts-workers', type=int, default=TTS_PRERENDER_WORKERS, help=f'Processes used to pre-render pyttsx3 phrases at startup, 1 for serial (default: {TTS_PRERENDER_WORKERS}).')
+    parser.add_argument('--cache_dir', '--cache-dir', type=str, default=None, help='Directory for a persistent cache of synthesized speech, reused across runs (default: no cache).')
+    parser.add_argument('--seed', type=int, default=None, help='Seed for the random element order, to repeat a session exactly (default: random, printed at start).')
+    parser.add_argument('--save_plan', '--save-plan', type=str, default=None, metavar='PLAN_PATH', help='Plan the session (see --seed and --plan_passes), save it to this file and exit without playing it.')
+    parser.add_argument('--plan_passes', '--plan-passes', type=int, default=1, help='Root note passes to plan with --save_plan; one pass plays every root note once (default: 1).')
+    parser.add_argument('--play_plan', '--play-plan', type=str, default=None, metavar='PLAN_PATH', help='Replay a saved plan; its degrees, root notes, octave and plays per root replace those arguments.')
+    parser.add_argument('--dry_run', '--dry-run', action='store_true', help='Validate the arguments and print the planned session without loading audio or TTS libraries.')
+    parser.add_argument('--simulate', action='store_true', help='Fast-forward --render_duration seconds of session on a virtual clock, without audio or TTS, and print the event timeline with pacing, root cycling and fairness statistics.')
+    parser.add_argument('--trace', type=str, default=None, metavar='JSON_PATH', help='Record a timeline of session events (speech, tones, sleeps, root changes) in Chrome Trace Event Format for chrome://tracing or Perfetto, written at exit (default: off).')
+    parser.add_argument('--shared_tones', '--shared-tones', type=str, default=None, metavar='DIR', help='Memory-map pre-rendered tones from a table in this directory (built on first use), shared by every session process on the machine (default: render tones per process).')
+    parser.add_argument('--assets', type=str, default=None, metavar='PACK_PATH', help='Take speech and tones from an asset pack made with the build-assets command, memory-mapped so startup skips TTS and tone synthesis (default: synthesize at startup).')
+    parser.add_argument('--metrics_out', '--metrics-out', type=str, default=None, metavar='JSON_PATH', help='Write per-stage latency histograms (p50/p95/p99/max) to this JSON file at exit and on SIGUSR1 (default: off).')
     args = parser.parse_args()
 
     # Validate numerical arguments
     if args.tone_name_delay < 0: args.tone_name_delay = 0.0
     if args.plays_per_root < 1: args.plays_per_root = 1
     if args.delay < 0: args.delay = 0.0
+    if args.render_duration < 0: args.render_duration = 0.0
+    if args.tts_workers < 1: args.tts_workers = 1
+    if args.plan_passes < 1: args.plan_passes = 1
+    if args.simulate and (args.audio_backend or args.render_to or args.pcm_out):
+        print("Error: --simulate produces no audio; it cannot be combined with an audio backend or output."); sys.exit(1)
+    if args.pcm_out:
+        if args.audio_backend not in (None, "pcm"):
+            print("Error: --pcm_out needs the pcm audio backend."); sys.exit(1)
+        args.audio_backend = "pcm"
+    if args.audio_backend is None: args.audio_backend = "wav" if args.render_to else "pygame"
+    if args.audio_backend == "wav" and not args.render_to:
+        print("Error: The wav audio backend needs an output file (--render_to)."); sys.exit(1)
+    pcm_to_stdout = args.audio_backend == "pcm" and args.pcm_out in (None, "-")
+    if pcm_to_stdout:
+        # stdout carries the audio stream, so progress messages go to stderr. TTS engines, pygame and worker
+        # processes may write to fd 1 directly, so the stream keeps its own copy of fd 1 and fd 1 itself is
+        # pointed at stderr before any of them start
+        sys.stdout.flush()
+        pcm_stream = os.fdopen(os.dup(sys.stdout.fileno()), "wb")
+        pcm_stream.raw.name = "<stdout>" # Shown as the render destination instead of the duplicate's fd number
+        os.dup2(sys.stderr.fileno(), sys.stdout.fileno())
+        sys.stdout = sys.stderr
 
-    # Parse and validate elements string
-    elements_list_raw_input = [elem.strip() for elem in args.elements_string.split(',') if elem.strip()]
-    if not elements_list_raw_input:
-        print("Error: No valid elements in elements_string."); sys.exit(1)
-    # unique_elements_as_input stores the exact strings from user input for tracking plays
-    unique_elements_as_input = sorted(list(set(elements_list_raw_input)))
-    print(f"Unique scale degrees to be practiced (as input): {unique_elements_as_input}")
-
-    # Parse and validate root notes, keeping original casing for announcements
-    root_notes_input_original_case = [rn.strip() for rn in args.root_notes.split(',') if rn.strip()]
-    if not root_notes_input_original_case:
-        print("Error: No valid root notes provided in --root_notes argument."); sys.exit(1)
+    session_plan = None
+    if args.play_plan:
+        # A saved plan fixes the degrees, root notes, octave and plays per root it was planned with
+        try:
+            session_plan = SessionPlan.load(args.play_plan)
+        except (OSError, ValueError) as e:
+            print(f"Error: Could not load session plan {args.play_plan}: {e}"); sys.exit(1)
+        unique_elements_as_input = session_plan.elements
+        root_notes_input_original_case = session_plan.root_notes
+        args.plays_per_root, args.octave = session_plan.plays_per_root, session_plan.octave
+        print(f"Replaying session plan {args.play_plan} (seed {session_plan.seed}, {len(session_plan.passes)} root pass(es))")
+        print(f"Unique scale degrees to be practiced (as input): {unique_elements_as_input}")
+    else:
+        if args.elements_string is None or args.root_notes is None:
+            print("Error: elements_string and --root_notes are required unless --play_plan is given."); sys.exit(1)
+        # Parse and validate elements string
+        elements_list_raw_input = [elem.strip() for elem in args.elements_string.split(',') if elem.strip()]
+        if not elements_list_raw_input:
+            print("Error: No valid elements in elements_string."); sys.exit(1)
+        # unique_elements_as_input stores the exact strings from user input for tracking plays
+        unique_elements_as_input = sorted(list(set(elements_list_raw_input)))
+        print(f"Unique scale degrees to be practiced (as input): {unique_elements_as_input}")
+
+        # Parse and validate root notes, keeping original casing for announcements
+        root_notes_input_original_case = [rn.strip() for rn in args.root_notes.split(',') if rn.strip()]
+        if not root_notes_input_original_case:
+            print("Error: No valid root notes provided in --root_notes argument."); sys.exit(1)
     
     for rn_str_orig in root_notes_input_original_case:
         if rn_str_orig.upper() not in ROOT_NOTES_SEMITONES_FROM_C:
@@ -253,115 +2711,76 @@ def main():
     print(f"Overall cycle delay: {args.delay}s, Tone duration: {TONE_DURATION_SEC}s, Note name speech delay: {args.tone_name_delay}s")
 
 
-    tts_engine = initialize_tts_engine()
-    try:
-        # Initialize Pygame mixer, try for mono but adapt if stereo
-        pygame.mixer.pre_init(SAMPLE_RATE, -16, 1, 512) 
-        pygame.init() # Initializes all pygame modules
-        mixer_status = pygame.mixer.get_init() # Check actual mixer settings
-        if not mixer_status:
-            print("CRITICAL ERROR: Pygame mixer failed to initialize."); sys.exit(1)
-        print(f"Pygame mixer initialized with: Frequency={mixer_status[0]}, Format={mixer_status[1]}, Channels={mixer_status[2]}")
-    except Exception as e:
-        print(f"Error initializing Pygame: {e}"); sys.exit(1)
-
-    current_root_note_idx = 0
-    # Use original case root note name for context and announcements
-    current_root_note_original_case = root_notes_input_original_case[current_root_note_idx] 
-    # Initial root note activation
-    current_root_midi_note, element_play_counts_for_current_root = activate_root_note(
-        current_root_note_original_case, args.octave, tts_engine, unique_elements_as_input
+    config = SessionConfig(
+        elements=unique_elements_as_input,
+        root_notes=root_notes_input_original_case,
+        plays_per_root=args.plays_per_root,
+        delay=args.delay,
+        octave=args.octave,
+        tone_name_delay=args.tone_name_delay,
+        audio_backend=args.audio_backend,
+        render_to=args.render_to,
+        render_duration=args.render_duration,
+        pcm_stream=pcm_stream if pcm_to_stdout else None,
+        pcm_out=args.pcm_out,
+        shared_tones=args.shared_tones,
+        assets=args.assets,
+        cache_dir=args.cache_dir,
+        tts_backend=args.tts_backend,
+        tts_workers=args.tts_workers,
+        seed=args.seed,
+        plan=session_plan,
     )
+    if args.save_plan:
+        new_plan = SessionPlan.record(config.elements, config.root_notes, config.plays_per_root, config.seed,
+                                      config.octave, args.plan_passes)
+        try:
+            new_plan.save(args.save_plan)
+        except OSError as e:
+            print(f"Error: Could not save session plan to {args.save_plan}: {e}"); sys.exit(1)
+        num_steps = sum(len(element_indices) for _, element_indices in new_plan.passes)
+        print(f"Saved session plan to {args.save_plan}: seed {new_plan.seed}, {len(new_plan.passes)} root pass(es), {num_steps} element(s).")
+        return
+    if args.dry_run:
+        print_session_plan(config)
+        return
+    if args.simulate:
+        try:
+            simulate_session(config)
+        except RuntimeError as e:
+            print(e); sys.exit(1)
+        return
 
+    # The trace starts before setup, so pre-rendering shows up in the timeline
+    metrics = StageMetrics(SessionTrace() if args.trace else None)
     try:
-        print(f"\nStarting practice. Press Ctrl+C to stop.")
-        while True:
-            # Check if current root note's practice session is complete
-            num_elements_fully_played_this_session = sum(
-                1 for el in unique_elements_as_input if element_play_counts_for_current_root.get(el, 0) >= args.plays_per_root
-            )
-
-            if num_elements_fully_played_this_session == len(unique_elements_as_input):
-                print(f"\n--- Root Note '{current_root_note_original_case}' session complete. ---")
-                current_root_note_idx = (current_root_note_idx + 1) % len(root_notes_input_original_case)
-                current_root_note_original_case = root_notes_input_original_case[current_root_note_idx]
-                current_root_midi_note, element_play_counts_for_current_root = activate_root_note(
-                    current_root_note_original_case, args.octave, tts_engine, unique_elements_as_input
-                )
-                print(f"--- Continuing with new root note: {current_root_note_original_case} ---")
-                continue # Restart loop for the new root note
-
-            # Select an element that still needs to be played for the current root note session
-            eligible_elements_to_play = [
-                el for el in unique_elements_as_input if element_play_counts_for_current_root.get(el, 0) < args.plays_per_root
-            ]
-            if not eligible_elements_to_play: # Should not happen if logic is correct
-                print("Error: No eligible elements to play, but root note switch condition not met. This may indicate a logic error."); time.sleep(1); continue 
-
-            selected_element_text_as_input = random.choice(eligible_elements_to_play) # This is the original string like "b3" or "flat 9"
-            
-            # For speaking the degree itself, get its human-friendly name
-            speakable_degree_name = get_speakable_degree_name(selected_element_text_as_input)
-            print(f"\nNext element for root {current_root_note_original_case}: '{selected_element_text_as_input}' (spoken as '{speakable_degree_name}')")
-            speak_text(tts_engine, speakable_degree_name) # 1. Speak scale degree
-            
-            # For internal logic and tone calculation, use the normalized version of the degree
-            normalized_degree_for_logic = normalize_degree_string(selected_element_text_as_input)
-            
-            frequency_to_play, target_midi_note_played = None, None
-            time_spent_on_audio_events = 0.0 # Track time for tone + note name speech
-
-            if normalized_degree_for_logic in DEGREE_SEMITONE_INTERVALS:
-                degree_interval = DEGREE_SEMITONE_INTERVALS[normalized_degree_for_logic]
-                frequency_to_play, target_midi_note_played = calculate_frequency_and_midi(
-                    current_root_midi_note, degree_interval
-                )
-            else:
-                # This case should ideally be caught by validating elements_string against DEGREE_SEMITONE_INTERVALS at startup
-                print(f"Warning: Scale degree '{selected_element_text_as_input}' (normalized to '{normalized_degree_for_logic}') not recognized in intervals dict.")
-
-            # 2. Play tone (if valid)
-            if frequency_to_play is not None:
-                play_generated_tone(frequency_to_play, TONE_DURATION_SEC)
-                time_spent_on_audio_events += TONE_DURATION_SEC
-
-                # 3. Wait, then speak note name (if tone was played)
-                if target_midi_note_played is not None:
-                    note_name_to_speak = get_note_name_from_midi(
-                        target_midi_note_played, 
-                        current_root_note_original_case, # Pass root note for context
-                        selected_element_text_as_input # Pass original degree string for context
-                    )
-                    time.sleep(args.tone_name_delay) # Wait before speaking note name
-                    time_spent_on_audio_events += args.tone_name_delay
-                    speak_text(tts_engine, note_name_to_speak) # 4. Speak note name
-            
-            # Update play count for the selected unique element in the current root note's session
-            element_play_counts_for_current_root[selected_element_text_as_input] = \
-                element_play_counts_for_current_root.get(selected_element_text_as_input, 0) + 1
-            
-            print(f"Element '{selected_element_text_as_input}' play count for root {current_root_note_original_case}: "
-                  f"{element_play_counts_for_current_root[selected_element_text_as_input]}/{args.plays_per_root}")
-
-            # 5. Calculate sleep time to maintain overall delay for the element cycle
-            # args.delay is the target time from the start of this cycle to the start of the next.
-            sleep_for = args.delay - time_spent_on_audio_events
-            
-            if sleep_for > 0:
-                time.sleep(sleep_for)
-            elif args.delay < time_spent_on_audio_events and time_spent_on_audio_events > 0: # Only warn if audio events actually happened
-                print(f"Warning: Target cycle delay ({args.delay}s) is less than time taken for audio events "
-                      f"({time_spent_on_audio_events:.2f}s). Effective delay will be longer.")
-            
+        output = open_session_output(config, metrics=metrics)
+    except RuntimeError as e:
+        print(e); sys.exit(1)
+
+    if args.metrics_out and hasattr(signal, "SIGUSR1"): # SIGUSR1 does not exist on Windows
+        # Dump from a helper thread: the handler runs on the main thread, which may hold the metrics lock
+        signal.signal(signal.SIGUSR1, lambda signum, frame: threading.Thread(
+            target=write_stage_metrics, args=(output.metrics, args.metrics_out), daemon=True).start())
+
+    try:
+        asyncio.run(run_session(config, output=output))
     except KeyboardInterrupt:
         print("\nProgram stopped by user.")
+    except BrokenPipeError:
+        print("Audio output closed by the reader (e.g., aplay or ffmpeg exited).")
+        if pcm_to_stdout:
+            # Point the audio stream at devnull so the final chunk and the flush at exit don't fail again
+            os.dup2(os.open(os.devnull, os.O_WRONLY), pcm_stream.fileno())
     except Exception as e:
         print(f"An unexpected error occurred: {e}")
     finally:
+        output.close()
+        if args.metrics_out:
+            write_stage_metrics(output.metrics, args.metrics_out)
+        if args.trace:
+            write_session_trace(output.metrics.trace, args.trace)
         print("Exiting program.")
-        pygame.quit()
 
 if __name__ == "__main__":
     main()
-
-
@@ -0,0 +1,164 @@
+"""Tests for scale_degree_speaker.py; run with `python -m pytest -q`."""
+import asyncio
+import concurrent.futures
+import json
+import os
+import tracemalloc
+
+import pytest
+
+numpy = pytest.importorskip("numpy")
+
+import scale_degree_speaker as sds
+
+# Python objects (metrics bookkeeping, frames) may take a few KiB; one 0.5 s int16 tone buffer is ~44 KB
+MAX_STEADY_STATE_BYTES = 16 * 1024
+
+def measure_allocations(run, calls=50):
+    """Returns (peak, net) bytes traced over calls runs of run(), after one warm-up call."""
+    run()
+    tracemalloc.start()
+    try:
+        before, _ = tracemalloc.get_traced_memory()
+        for _ in range(calls):
+            run()
+        after, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return peak - before, after - before
+
+@pytest.mark.parametrize("num_channels", [1, 2])
+@pytest.mark.parametrize("mixer_format", [-16, 8])
+def test_tone_renderer_allocates_nothing_after_warm_up(num_channels, mixer_format):
+    renderer = sds.ToneRenderer(num_channels, mixer_format=mixer_format)
+    frequencies = iter(440.0 * 2 ** (i / 12) for i in range(10**6))
+    peak, net = measure_allocations(lambda: renderer.render(next(frequencies), sds.TONE_DURATION_SEC))
+    assert peak < MAX_STEADY_STATE_BYTES
+    assert net < MAX_STEADY_STATE_BYTES
+
+def test_oscillator_chunks_match_one_render():
+    whole = sds.WavetableOscillator(440.0).render(4000)
+    oscillator = sds.WavetableOscillator(440.0)
+    chunked = numpy.concatenate([oscillator.render(1000) for _ in range(4)])
+    assert numpy.array_equal(whole, chunked)
+
+def test_oscillator_matches_sine():
+    samples = sds.generate_sine_wave_array(440.0, 1.0)
+    t = numpy.arange(len(samples)) / sds.SAMPLE_RATE
+    expected = numpy.sin(2 * numpy.pi * 440.0 * t) * (2**15 - 1) * sds.TONE_AMPLITUDE_FACTOR
+    assert samples.dtype == numpy.int16
+    # Nearest-sample lookup and the fixed-point phase increment keep the error within 2 LSB
+    assert numpy.abs(samples - expected).max() <= 2
+
+@pytest.mark.parametrize("contents", [b"", b"\x93NUMPY truncated"])
+def test_speech_cache_treats_corrupt_entry_as_miss(tmp_path, contents):
+    cache = sds.SpeechDiskCache(str(tmp_path), "voice", 175)
+    entry_path = cache._entry_path("flat 3")
+    with open(entry_path, "wb") as entry_file:
+        entry_file.write(contents)
+    assert cache.get("flat 3") is None
+    assert not (tmp_path / entry_path).exists()
+
+def test_generate_sine_wave_array_is_thread_safe():
+    frequencies = [220.0 * 2 ** (i / 12) for i in range(16)]
+    expected = [sds.generate_sine_wave_array(frequency, 0.25) for frequency in frequencies]
+    with concurrent.futures.ThreadPoolExecutor(max_workers=8) as pool:
+        for _ in range(20):
+            results = list(pool.map(lambda frequency: sds.generate_sine_wave_array(frequency, 0.25), frequencies))
+            assert all(numpy.array_equal(result, want) for result, want in zip(results, expected))
+
+@pytest.mark.parametrize("jobs", [
+    [{"elements": "1", "root_notes": "C", "output": "a.wav"}, {"elements": "b3", "root_notes": "D", "output": "./a.wav"}],
+    [{"elements": "1", "root_notes": "C", "output": "../a.wav"}],
+    [{"elements": "1", "root_notes": "C", "output": os.path.abspath("a.wav")}],
+    [{"elements": "1", "root_notes": "C", "delay": None}],
+])
+def test_batch_manifest_rejects_bad_jobs(tmp_path, jobs):
+    manifest_path = tmp_path / "manifest.json"
+    manifest_path.write_text(json.dumps(jobs))
+    with pytest.raises(ValueError):
+        sds.load_batch_manifest(str(manifest_path), str(tmp_path / "out"))
+
+def test_session_plan_round_trip(tmp_path):
+    plan = sds.SessionPlan.record(["1", "b3", "5"], ["C", "F#"], plays_per_root=2, seed=1234, octave=3, num_passes=3)
+    plan_path = str(tmp_path / "plan.json")
+    plan.save(plan_path)
+    loaded = sds.SessionPlan.load(plan_path)
+    assert loaded == plan
+    assert list(loaded.steps()) == list(plan.steps())
+    # The replayed steps are the first passes of the live planner, in order
+    planned = sds.plan_session(["1", "b3", "5"], ["C", "F#"], plays_per_root=2, seed=1234, octave=3)
+    assert list(loaded.steps()) == [next(planned) for _ in range(len(list(plan.steps())))]
+
+@pytest.mark.parametrize("field, value", [
+    ("passes", [[0, ["1"]]]), ("passes", [0, [1]]), ("passes", [[0]]), ("octave", "4"), ("plays_per_root", 0),
+])
+def test_session_plan_load_rejects_malformed_fields(tmp_path, field, value):
+    plan = sds.SessionPlan.record(["1", "b3"], ["C"], seed=1)
+    plan_path = tmp_path / "plan.json"
+    plan.save(str(plan_path))
+    plan_json = json.loads(plan_path.read_text())
+    plan_json[field] = value
+    plan_path.write_text(json.dumps(plan_json))
+    with pytest.raises(ValueError):
+        sds.SessionPlan.load(str(plan_path))
+
+def test_concurrent_sessions_keep_their_own_metrics():
+    short = sds.SessionConfig(["1", "b3"], ["C"], tts_backend="fake", audio_backend="null", render_duration=10, seed=1)
+    long = sds.dataclasses.replace(short, render_duration=60)
+    outputs = [sds.open_session_output(config) for config in (short, long)]
+
+    async def run_both():
+        await asyncio.gather(*(sds.run_session(config, output=output) for config, output in zip((short, long), outputs)))
+    asyncio.run(run_both())
+    for output in outputs:
+        output.close()
+    short_selections, long_selections = (output.metrics.to_dict()["stages"]["selection"]["count"] for output in outputs)
+    assert 0 < short_selections < long_selections
+
+def test_asset_pack_round_trip(tmp_path):
+    backend = sds.FakeTtsBackend()
+    phrases = ["flat 3", "New Root Note: C"]
+    pack_path = tmp_path / "assets.pack"
+    sds.build_asset_pack(str(pack_path), backend, phrases)
+    assert [path.name for path in tmp_path.iterdir()] == ["assets.pack"]
+    assert pack_path.stat().st_mode & 0o777 == 0o644
+
+    pack = sds.AssetPack(str(pack_path))
+    assert (pack.voice_id, pack.sample_rate, pack.tone_durations) == ("fake", sds.SAMPLE_RATE, [sds.TONE_DURATION_SEC])
+    for phrase, speech in backend.synthesize(phrases).items():
+        assert numpy.array_equal(pack.get_phrase(phrase), speech)
+    assert pack.get_phrase("not packed") is None
+    assert numpy.array_equal(pack.get_tone(69, sds.TONE_DURATION_SEC),
+                             sds.generate_sine_wave_array(440.0, sds.TONE_DURATION_SEC))
+
+def test_atomic_replace_keeps_old_file_on_error(tmp_path):
+    target = tmp_path / "metrics.json"
+    target.write_text("old")
+    with pytest.raises(RuntimeError):
+        with sds.atomic_replace(str(target)) as temp_path, open(temp_path, "w") as temp_file:
+            temp_file.write("partial")
+            raise RuntimeError("interrupted")
+    assert target.read_text() == "old"
+    assert [path.name for path in tmp_path.iterdir()] == ["metrics.json"]
+
+def test_fake_backend_speaks_on_its_clock():
+    clock = sds.VirtualClock()
+    backend = sds.FakeTtsBackend(clock)
+    backend.speak("New Root Note: C")
+    assert clock.now() == pytest.approx(backend.speech_duration_sec("New Root Note: C"))
+
+def test_playback_worker_synthesizes_missing_speech_for_the_mixer(monkeypatch):
+    monkeypatch.setenv("SDL_AUDIODRIVER", "dummy")
+    pygame = pytest.importorskip("pygame")
+    pygame.mixer.init(sds.SAMPLE_RATE, -16, 1)
+    try:
+        backend = sds.FakeTtsBackend()
+        monkeypatch.setattr(backend, "speak", lambda text: pytest.fail("speech bypassed the mixer"))
+        phrase_bank = sds.PhraseBank(backend)
+        worker = sds.PlaybackWorker(backend, phrase_bank=phrase_bank)
+        worker._speak("sharp 4")
+        assert "sharp 4" in phrase_bank
+        assert phrase_bank.get_sound("sharp 4") is not None
+    finally:
+        pygame.mixer.quit()